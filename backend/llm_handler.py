@@ -16,6 +16,13 @@ root_dir = Path(__file__).parent.parent
 env_path = root_dir / '.env'
 load_dotenv(dotenv_path=env_path)
 
+# Fast C JSON decoder for model responses (orjson.JSONDecodeError subclasses json.JSONDecodeError)
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
 # Import OpenAI
 try:
     from openai import OpenAI
@@ -140,7 +147,7 @@ class LLMReportGenerator:
                     cleaned_text = cleaned_text[:-3]
                 cleaned_text = cleaned_text.strip()
                 
-                analysis = json.loads(cleaned_text)
+                analysis = _json_loads(cleaned_text)
                 print(f"✅ JSON parsed successfully")
             except json.JSONDecodeError as e:
                 print(f"⚠️ JSON decode error: {str(e)}")
@@ -195,7 +202,7 @@ Analyze the image and respond with ONLY the JSON object, no additional text."""
         json_match = re.search(r'\{[^{}]*\}', text, re.DOTALL)
         if json_match:
             try:
-                return json.loads(json_match.group(0))
+                return _json_loads(json_match.group(0))
             except:
                 pass
         
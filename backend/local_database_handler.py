@@ -7,11 +7,21 @@ Replaces Firebase Firestore with local SQLite database
 import sqlite3
 import json
 import os
+import traceback
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Sequence, Tuple
 from pathlib import Path
 from contextlib import contextmanager
 
+# Columns of the detection_reports table (used to validate projected queries)
+REPORT_COLUMNS = frozenset({
+    'report_id', 'timestamp', 'location_latitude', 'location_longitude',
+    'soldier_count', 'attire_and_camouflage', 'environment', 'equipment',
+    'image_snapshot_url', 'segmented_image_url', 'source_device_id',
+    'severity', 'status', 'assignee', 'notes', 'ai_summary',
+    'created_at', 'updated_at'
+})
+
 class LocalDatabaseHandler:
     def __init__(self, db_path: str = "storage/mirqab.db"):
         """
@@ -83,7 +93,6 @@ class LocalDatabaseHandler:
             
         except Exception as e:
             print(f"❌ Error initializing Local Database: {e}")
-            import traceback
             traceback.print_exc()
             return False
     
@@ -157,7 +166,6 @@ class LocalDatabaseHandler:
                 
         except Exception as e:
             print(f"❌ Error saving report: {e}")
-            import traceback
             traceback.print_exc()
             return False
     
@@ -194,7 +202,8 @@ class LocalDatabaseHandler:
                      end_date: Optional[datetime] = None,
                      device_id: Optional[str] = None,
                      limit: int = 100,
-                     offset: int = 0) -> List[Dict]:
+                     offset: int = 0,
+                     fields: Optional[Sequence[str]] = None) -> List[Dict]:
         """
         Query reports with filters
         
@@ -204,6 +213,8 @@ class LocalDatabaseHandler:
             device_id: Filter by source device
             limit: Maximum number of reports to return
             offset: Number of reports to skip
+            fields: Optional column names to load; when given, rows are returned
+                    as flat {column: value} dicts instead of the full report structure
         
         Returns:
             List[Dict]: List of reports matching the criteria
@@ -213,11 +224,19 @@ class LocalDatabaseHandler:
                 print("❌ Local Database not initialized")
                 return []
             
+            if fields is not None:
+                invalid = [f for f in fields if f not in REPORT_COLUMNS]
+                if invalid:
+                    raise ValueError(f"Unknown report fields: {invalid}")
+                columns = ', '.join(fields)
+            else:
+                columns = '*'
+            
             with self._get_connection() as conn:
                 cursor = conn.cursor()
                 
                 # Build query
-                query = 'SELECT * FROM detection_reports WHERE 1=1'
+                query = f'SELECT {columns} FROM detection_reports WHERE 1=1'
                 params = []
                 
                 if start_date:
@@ -238,15 +257,17 @@ class LocalDatabaseHandler:
                 cursor.execute(query, params)
                 rows = cursor.fetchall()
                 
+                if fields is not None:
+                    return [dict(row) for row in rows]
                 return [self._row_to_dict(row) for row in rows]
                 
         except Exception as e:
             print(f"❌ Error querying reports: {e}")
-            import traceback
             traceback.print_exc()
             return []
     
-    def get_detection_reports(self, time_range: str = "24h", limit: int = 100, offset: int = 0) -> List[Dict]:
+    def get_detection_reports(self, time_range: str = "24h", limit: int = 100, offset: int = 0,
+                              fields: Optional[Sequence[str]] = None) -> List[Dict]:
         """
         Get detection reports for a given time range
         
@@ -254,10 +275,59 @@ class LocalDatabaseHandler:
             time_range: '24h', '7d', '30d', etc.
             limit: Maximum number of reports
             offset: Skip first N reports
+            fields: Optional column names to load (see query_reports)
         
         Returns:
             List[Dict]: List of report dictionaries
         """
+        start_date, end_date = self._time_range_bounds(time_range)
+        
+        return self.query_reports(start_date=start_date, end_date=end_date, limit=limit, offset=offset, fields=fields)
+    
+    def aggregate_stats(self, time_range: str = "24h", critical_threshold: int = 3) -> Tuple[int, int]:
+        """
+        Count reports and critical alerts for a time range in a single query
+        
+        Args:
+            time_range: '24h', '7d', '30d', etc.
+            critical_threshold: Minimum soldier count for a critical alert
+        
+        Returns:
+            Tuple[int, int]: (total reports, critical alerts)
+        """
+        try:
+            if not self._initialized:
+                print("❌ Local Database not initialized")
+                return 0, 0
+            
+            start_date, end_date = self._time_range_bounds(time_range)
+            
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                
+                query = '''
+                    SELECT COUNT(*),
+                           SUM(CASE WHEN soldier_count >= ? THEN 1 ELSE 0 END)
+                    FROM detection_reports
+                    WHERE timestamp <= ?
+                '''
+                params = [critical_threshold, end_date.isoformat()]
+                
+                if start_date:
+                    query += ' AND timestamp >= ?'
+                    params.append(start_date.isoformat())
+                
+                cursor.execute(query, params)
+                total, critical = cursor.fetchone()
+                return total, critical or 0
+                
+        except Exception as e:
+            print(f"❌ Error aggregating statistics: {e}")
+            traceback.print_exc()
+            return 0, 0
+    
+    def _time_range_bounds(self, time_range: str) -> Tuple[Optional[datetime], datetime]:
+        """Convert a '24h' / '7d' / '30d' time range into (start_date, end_date)"""
         end_date = datetime.now()
         
         if time_range == "24h":
@@ -269,7 +339,7 @@ class LocalDatabaseHandler:
         else:
             start_date = None
         
-        return self.query_reports(start_date=start_date, end_date=end_date, limit=limit, offset=offset)
+        return start_date, end_date
     
     def update_report(self, report_id: str, update_data: Dict) -> bool:
         """
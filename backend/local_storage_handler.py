@@ -11,6 +11,7 @@ from datetime import datetime
 from typing import Optional
 from pathlib import Path
 import shutil
+import traceback
 
 class LocalStorageHandler:
     def __init__(self, storage_dir: str = "storage", base_url: str = "http://localhost:8000"):
@@ -71,6 +72,30 @@ class LocalStorageHandler:
             
             image_bytes = base64.b64decode(image_data)
             
+            return self.upload_image_bytes(image_bytes, report_id, image_type)
+            
+        except Exception as e:
+            print(f"❌ Error saving image: {e}")
+            traceback.print_exc()
+            return None
+    
+    def upload_image_bytes(self, image_bytes: bytes, report_id: str, image_type: str = "original") -> Optional[str]:
+        """
+        Save already-encoded JPEG bytes to local filesystem (no base64 round-trip)
+        
+        Args:
+            image_bytes: Encoded JPEG image bytes
+            report_id: Report ID for organizing files
+            image_type: Type of image (original, segmented, etc.)
+        
+        Returns:
+            str: Relative URL path to access the image, or None if failed
+        """
+        try:
+            if not self._initialized:
+                print("❌ Local Storage not initialized")
+                return None
+            
             # Create report directory
             report_dir = self.storage_dir / "reports" / report_id
             report_dir.mkdir(parents=True, exist_ok=True)
@@ -93,7 +118,6 @@ class LocalStorageHandler:
             
         except Exception as e:
             print(f"❌ Error saving image: {e}")
-            import traceback
             traceback.print_exc()
             return None
     
@@ -3,21 +3,26 @@ Mirqab Backend - Main FastAPI Application
 Automatic AI Report Generation with Complete PDF Export Support
 """
 
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, ORJSONResponse
 from PIL import Image
-import io
 import json
-import base64
+import binascii
 import uuid
 from datetime import datetime
 import numpy as np
 import cv2
 import tempfile
 import os
+import traceback
+import asyncio
+import operator
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from urllib.parse import urlparse
 from dotenv import load_dotenv
+import httpx
 
 # ✅ NEW: Load environment variables from project root (not from backend directory)
 root_dir = Path(__file__).parent.parent
@@ -30,15 +35,22 @@ load_dotenv(dotenv_path=env_path)
 api_key = os.getenv('OPENAI_API_KEY')
 print(f"OpenAI API Key loaded: {bool(api_key)}")
 
+# Cap intra-op threads so concurrent requests don't oversubscribe the CPU.
+# Run uvicorn with --workers N (WEB_CONCURRENCY) so that N * INTRA_OP_THREADS == cpu_count.
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+INTRA_OP_THREADS = int(os.getenv("INTRA_OP_THREADS", max(1, (os.cpu_count() or 1) // WEB_CONCURRENCY)))
+os.environ.setdefault("OMP_NUM_THREADS", str(INTRA_OP_THREADS))
+cv2.setNumThreads(INTRA_OP_THREADS)
+
 from model_handler import SegmentationModel
 from llm_handler import LLMReportGenerator
-from utils import detect_soldiers, encode_image_to_base64, overlay_mask_on_image
+from utils import detect_soldiers, encode_image_bytes, bytes_to_data_uri, encode_image_to_base64, overlay_mask_on_image, decode_image_bytes, open_video_writer
 from local_database_handler import local_database_handler
 from local_storage_handler import local_storage_handler
 from moraqib_rag import initialize_rag
 from fastapi.staticfiles import StaticFiles
 
-app = FastAPI(title="Camoubusters API")
+app = FastAPI(title="Camoubusters API", default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -48,9 +60,43 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-model = SegmentationModel()
+model = SegmentationModel(intra_op_threads=INTRA_OP_THREADS)
 llm = LLMReportGenerator()
 
+# Bounded pool for model inference so the event loop stays responsive
+# (kept small to avoid GPU contention between concurrent requests)
+inference_pool = ThreadPoolExecutor(max_workers=2)
+
+
+# Largest image side fed to the model; bigger uploads are downscaled first
+# (the network itself runs at 256x256, so full-resolution input only costs copies)
+INFERENCE_MAX_DIM = 1024
+
+# Shared async HTTP client for fetching external images (connection pooling)
+httpx_client = httpx.AsyncClient(timeout=10, follow_redirects=True, limits=httpx.Limits(max_connections=32))
+
+
+async def run_inference(func, *args):
+    """Run a blocking model call on the inference pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(inference_pool, func, *args)
+
+
+def predict_downscaled(image_rgb: np.ndarray):
+    """
+    Run model.predict on an RGB array, downscaling it to INFERENCE_MAX_DIM first
+    and upscaling the returned mask back to the original resolution.
+    """
+    h, w = image_rgb.shape[:2]
+    scale = min(1.0, INFERENCE_MAX_DIM / max(h, w))
+    if scale >= 1.0:
+        return model.predict(image_rgb)
+    
+    small = cv2.resize(image_rgb, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    mask, seg_map = model.predict(small)
+    mask = cv2.resize(mask, (w, h), interpolation=cv2.INTER_NEAREST)
+    return mask, mask if seg_map is mask else cv2.resize(seg_map, (w, h), interpolation=cv2.INTER_NEAREST)
+
 # Initialize Moraqib RAG system
 moraqib_rag = None
 
@@ -95,6 +141,13 @@ async def startup_event():
     
     print("✅ Ready for automatic AI report generation!")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    await httpx_client.aclose()
+    if moraqib_rag:
+        await moraqib_rag.close()
+    inference_pool.shutdown(wait=False)
+
 @app.get("/health")
 async def health_check():
     return {
@@ -103,8 +156,37 @@ async def health_check():
         "openai_api_available": llm.check_connection()
     }
 
+def save_report_and_upload_images(report_id: str, original_bytes: bytes, overlay_bytes: bytes, database_report_data: dict):
+    """
+    Upload report images to Local Storage and save the report to Local Database.
+    Runs as a background task so the upload response is not blocked on disk I/O.
+    """
+    try:
+        print("💾 Saving report to Local Database...")
+        
+        # Upload images to Local Storage first to get URLs
+        # (already-encoded JPEG bytes - no base64 round-trip)
+        original_url = local_storage_handler.upload_image_bytes(original_bytes, report_id, "original")
+        segmented_url = local_storage_handler.upload_image_bytes(overlay_bytes, report_id, "segmented")
+        
+        database_report_data["image_snapshot_url"] = original_url or ""
+        database_report_data["segmented_image_url"] = segmented_url or ""
+        
+        success = local_database_handler.save_report(database_report_data)
+        if success:
+            print(f"✅ Report saved to Local Database: {report_id}")
+            if original_url and segmented_url:
+                print(f"✅ Images saved to Local Storage")
+        else:
+            print("⚠️ Failed to save report to Local Database")
+            
+    except Exception as e:
+        print(f"⚠️ Error saving to Local Database: {e}")
+        traceback.print_exc()
+
 @app.post("/api/analyze_media")
 async def analyze_media(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     location: str = Form(None)
 ):
@@ -118,11 +200,11 @@ async def analyze_media(
         
         # Read and prepare image
         contents = await file.read()
-        image = Image.open(io.BytesIO(contents)).convert("RGB")
+        image_rgb = decode_image_bytes(contents)
         
         # Perform soldier detection
         print("🔍 Analyzing image for camouflaged soldiers...")
-        mask, instances = model.predict(image)
+        mask, instances = await run_inference(predict_downscaled, image_rgb)
         
         # Count soldiers, civilians, and total from mask (DeepLabV3 semantic segmentation)
         soldier_count = 0
@@ -148,20 +230,20 @@ async def analyze_media(
         print(f"   - Total detections: {total_detections}")
         
         # Create overlay image
-        overlay_image = overlay_mask_on_image(image, mask)
-        overlay_base64 = encode_image_to_base64(overlay_image)
+        overlay_image = overlay_mask_on_image(image_rgb, mask)
+        overlay_bytes = encode_image_bytes(overlay_image)
+        overlay_base64 = bytes_to_data_uri(overlay_bytes)
         
-        # Encode original image with data URI prefix
-        buffered = io.BytesIO()
-        image.save(buffered, format="JPEG")
-        original_base64 = f"data:image/jpeg;base64,{base64.b64encode(buffered.getvalue()).decode('utf-8')}"
+        # Encode original image once; the bytes go to storage, the data URI to the response
+        original_bytes = encode_image_bytes(image_rgb)
+        original_base64 = bytes_to_data_uri(original_bytes)
         
         # Generate AI analysis automatically
         ai_analysis = None
         if soldier_count > 0:
             print(f"🤖 Generating AI analysis report...")
             try:
-                ai_analysis = await llm.generate_report(image)
+                ai_analysis = await llm.generate_report(Image.fromarray(image_rgb))
                 print("✅ AI analysis complete!")
             except Exception as e:
                 print(f"⚠️ AI analysis failed ({str(e)}), using fallback report")
@@ -222,40 +304,22 @@ async def analyze_media(
         # Generate unique report ID
         report_id = str(uuid.uuid4())[:8].upper()
         
-        # Save report to Local Database
-        try:
-            print("💾 Saving report to Local Database...")
-            
-            # Upload images to Local Storage first to get URLs
-            original_url = local_storage_handler.upload_image(original_base64, report_id, "original")
-            segmented_url = local_storage_handler.upload_image(overlay_base64, report_id, "segmented")
-            
-            database_report_data = {
-                "report_id": report_id,
-                "timestamp": timestamp,
-                "location": report_location,
-                "soldier_count": ai_analysis.get("camouflaged_soldier_count", ai_analysis.get("soldier_count", camouflaged_count)),
-                "attire_and_camouflage": ai_analysis.get("attire_and_camouflage", ai_analysis.get("attire", "Unknown")),
-                "environment": ai_analysis.get("environment", "Unknown"),
-                "equipment": ai_analysis.get("equipment", "Unknown"),
-                "image_snapshot_url": original_url or "",
-                "segmented_image_url": segmented_url or "",
-                "source_device_id": "Web-Upload",
-                "ai_summary": ai_analysis.get("summary", "")
-            }
-            
-            success = local_database_handler.save_report(database_report_data)
-            if success:
-                print(f"✅ Report saved to Local Database: {report_id}")
-                if original_url and segmented_url:
-                    print(f"✅ Images saved to Local Storage")
-            else:
-                print("⚠️ Failed to save report to Local Database")
-                
-        except Exception as e:
-            print(f"⚠️ Error saving to Local Database: {e}")
-            import traceback
-            traceback.print_exc()
+        # Save report to Local Database after the response is sent
+        database_report_data = {
+            "report_id": report_id,
+            "timestamp": timestamp,
+            "location": report_location,
+            "soldier_count": ai_analysis.get("camouflaged_soldier_count", ai_analysis.get("soldier_count", camouflaged_count)),
+            "attire_and_camouflage": ai_analysis.get("attire_and_camouflage", ai_analysis.get("attire", "Unknown")),
+            "environment": ai_analysis.get("environment", "Unknown"),
+            "equipment": ai_analysis.get("equipment", "Unknown"),
+            "source_device_id": "Web-Upload",
+            "ai_summary": ai_analysis.get("summary", "")
+        }
+        background_tasks.add_task(
+            save_report_and_upload_images,
+            report_id, original_bytes, overlay_bytes, database_report_data
+        )
         
         # Build complete report object with the report ID
         # Use Firebase field names for consistency
@@ -299,7 +363,6 @@ async def analyze_media(
     
     except Exception as e:
         print(f"❌ Error in analyze_media: {str(e)}")
-        import traceback
         traceback.print_exc()
         return {
             "success": False,
@@ -307,6 +370,48 @@ async def analyze_media(
             "detection": False
         }
 
+# Columns loaded for the Detection Reports dashboard, in build_detection argument order
+DETECTION_FIELDS = (
+    "report_id", "timestamp", "location_latitude", "location_longitude",
+    "soldier_count", "attire_and_camouflage", "environment", "equipment",
+    "image_snapshot_url", "source_device_id", "segmented_image_url"
+)
+
+# Severity by soldier count (3 or more is High)
+SEVERITY_BY_COUNT = ("Low", "Low", "Medium", "High")
+
+
+def severity_for(soldier_count) -> str:
+    return SEVERITY_BY_COUNT[max(0, min(soldier_count or 0, 3))]
+
+
+def build_detection(report_id, timestamp, latitude, longitude, soldier_count,
+                    attire_and_camouflage, environment, equipment,
+                    image_snapshot_url, source_device_id, segmented_image_url) -> dict:
+    """
+    Shape a projected report row into the frontend detection interface
+    (NULL columns fall back to the dashboard defaults: "", 0 or "Unknown")
+    """
+    return {
+        "report_id": report_id or "",
+        "timestamp": timestamp or "",
+        "location": {
+            "latitude": latitude or 0,
+            "longitude": longitude or 0
+        },
+        "soldier_count": soldier_count or 0,
+        "attire_and_camouflage": attire_and_camouflage or "Unknown",
+        "environment": environment or "Unknown",
+        "equipment": equipment or "Unknown",
+        "image_snapshot_url": image_snapshot_url or "",
+        "source_device_id": source_device_id or "",
+        "segmented_image_url": segmented_image_url or "",
+        # Additional SOC fields
+        "severity": severity_for(soldier_count),
+        "status": "New",
+        "assignee": "Unassigned"
+    }
+
 @app.get("/api/detection-reports")
 async def get_detection_reports(
     time_range: str = "24h",
@@ -326,37 +431,17 @@ async def get_detection_reports(
         
         print(f"📊 Fetching detection reports (time_range: {time_range}, limit: {limit})")
         
-        # Get reports from Local Database
+        # Get reports from Local Database (only the columns the dashboard needs)
         reports = local_database_handler.get_detection_reports(
             time_range=time_range,
             limit=limit,
-            offset=offset
+            offset=offset,
+            fields=DETECTION_FIELDS
         )
         
         # Transform reports to match frontend interface
-        detections = []
-        for report in reports:
-            location = report.get("location", {})
-            detection = {
-                "report_id": report.get("report_id", ""),
-                "timestamp": report.get("timestamp", ""),
-                "location": {
-                    "latitude": location.get("latitude", 0),
-                    "longitude": location.get("longitude", 0)
-                },
-                "soldier_count": report.get("soldier_count", 0),
-                "attire_and_camouflage": report.get("attire_and_camouflage", "Unknown"),
-                "environment": report.get("environment", "Unknown"),
-                "equipment": report.get("equipment", "Unknown"),
-                "image_snapshot_url": report.get("image_snapshot_url", ""),
-                "source_device_id": report.get("source_device_id", ""),
-                "segmented_image_url": report.get("segmented_image_url", ""),
-                # Additional SOC fields
-                "severity": "High" if report.get("soldier_count", 0) >= 3 else "Medium" if report.get("soldier_count", 0) >= 2 else "Low",
-                "status": "New",
-                "assignee": "Unassigned"
-            }
-            detections.append(detection)
+        get_fields = operator.itemgetter(*DETECTION_FIELDS)
+        detections = [build_detection(*get_fields(r)) for r in reports]
         
         print(f"✅ Retrieved {len(detections)} detection reports")
         
@@ -369,7 +454,6 @@ async def get_detection_reports(
         
     except Exception as e:
         print(f"❌ Error fetching detection reports: {e}")
-        import traceback
         traceback.print_exc()
         return {
             "success": False,
@@ -417,7 +501,7 @@ async def get_detection_report(report_id: str):
             "source_device_id": report.get("source_device_id", ""),
             "segmented_image_url": report.get("segmented_image_url", ""),
             # Additional SOC fields
-            "severity": "High" if report.get("soldier_count", 0) >= 3 else "Medium" if report.get("soldier_count", 0) >= 2 else "Low",
+            "severity": severity_for(report.get("soldier_count", 0)),
             "status": "New",
             "assignee": "Unassigned"
         }
@@ -431,7 +515,6 @@ async def get_detection_report(report_id: str):
         
     except Exception as e:
         print(f"❌ Error fetching detection report: {e}")
-        import traceback
         traceback.print_exc()
         return {
             "success": False,
@@ -453,11 +536,8 @@ async def get_detection_stats(time_range: str = "24h"):
         
         print(f"📈 Fetching detection statistics (time_range: {time_range})")
         
-        # Get reports for statistics
-        reports = local_database_handler.get_detection_reports(time_range=time_range, limit=1000)
-        
-        total_detections = len(reports)
-        critical_alerts = sum(1 for r in reports if r["soldier_count"] >= 3)
+        # Aggregate counts in the database instead of loading the reports
+        total_detections, critical_alerts = local_database_handler.aggregate_stats(time_range)
         
         # Calculate MTTD and MTTR (mock values for now)
         mttd = "4.5 Hours"
@@ -506,18 +586,15 @@ async def test_segmentation(file: UploadFile = File(...)):
         nparr = np.frombuffer(contents, np.uint8)
         image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
         image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        pil_image = Image.fromarray(image_rgb)
         
         # Run segmentation to get binary mask (ignore instances for test mode)
-        mask, _ = model.predict(pil_image)
+        mask, _ = await run_inference(predict_downscaled, image_rgb)
         
-        # Create overlay image using utility function
-        overlay_image = overlay_mask_on_image(pil_image, mask, alpha=0.5)
+        # Create overlay image using utility function (straight from the RGB array)
+        overlay_image = overlay_mask_on_image(image_rgb, mask, alpha=0.5)
         
         # Convert to base64
-        buffered = io.BytesIO()
-        overlay_image.save(buffered, format="JPEG", quality=70)
-        overlay_base64 = f"data:image/jpeg;base64,{base64.b64encode(buffered.getvalue()).decode('utf-8')}"
+        overlay_base64 = encode_image_to_base64(overlay_image, quality=70)
         
         print("✅ Test overlay generated")
         return {
@@ -527,7 +604,6 @@ async def test_segmentation(file: UploadFile = File(...)):
     
     except Exception as e:
         print(f"❌ Test segmentation error: {str(e)}")
-        import traceback
         traceback.print_exc()
         return {
             "success": False,
@@ -553,6 +629,63 @@ async def report_detection(data: dict):
         "api_key": "your-api-key"
     }
     """
+    image_data = data.get("image_data")
+    upload_image = None
+    if image_data:
+        upload_image = lambda report_id: local_storage_handler.upload_image(image_data, report_id, "detection")
+    return await store_pi_report(data, upload_image)
+
+@app.post("/api/report_detection_upload")
+async def report_detection_upload(
+    image: UploadFile = File(None),
+    source_device_id: str = Form("Unknown"),
+    detection_type: str = Form(None),
+    confidence_score: float = Form(None),
+    summary_text: str = Form("Detection event"),
+    metadata: str = Form("{}"),
+    api_key: str = Form("")
+):
+    """
+    Multipart variant of /api/report_detection: the JPEG is sent as raw bytes
+    in the "image" file field (no base64 encode on the Pi / decode here, ~33% smaller).
+    The other fields match the JSON payload; "metadata" is a JSON string.
+    """
+    try:
+        metadata_data = json.loads(metadata) if metadata else {}
+    except ValueError:
+        metadata_data = None
+    if not isinstance(metadata_data, dict):
+        return {
+            "success": False,
+            "error": "metadata must be a JSON object string"
+        }
+    
+    data = {
+        "source_device_id": source_device_id,
+        "detection_type": detection_type,
+        "confidence_score": confidence_score,
+        "summary_text": summary_text,
+        "metadata": metadata_data,
+        "api_key": api_key
+    }
+    upload_image = None
+    if image is not None:
+        image_bytes = await image.read()
+        if image_bytes:
+            upload_image = lambda report_id: local_storage_handler.upload_image_bytes(image_bytes, report_id, "detection")
+    return await store_pi_report(data, upload_image)
+
+async def store_pi_report(data: dict, upload_image=None):
+    """
+    Validate and store a Raspberry Pi detection report
+    
+    Args:
+        data: Report fields (source_device_id, summary_text, metadata, api_key, ...)
+        upload_image: Optional callable(report_id) -> image URL, run in a worker thread
+    
+    Returns:
+        API response dict
+    """
     try:
         print("📡 Received detection report from Raspberry Pi...")
         
@@ -578,10 +711,9 @@ async def report_detection(data: dict):
         
         # Extract and prepare report data
         image_url = ""
-        image_data = data.get("image_data")
-        if image_data:
+        if upload_image:
             # Upload image to local storage
-            image_url = local_storage_handler.upload_image(image_data, report_id, "detection")
+            image_url = await asyncio.to_thread(upload_image, report_id)
         
         report_data = {
             "report_id": report_id,
@@ -596,7 +728,7 @@ async def report_detection(data: dict):
         }
         
         # Save report to Local Database
-        success = local_database_handler.save_report(report_data)
+        success = await asyncio.to_thread(local_database_handler.save_report, report_data)
         
         if success:
             print(f"✅ Detection report saved: {report_id}")
@@ -615,7 +747,6 @@ async def report_detection(data: dict):
     
     except Exception as e:
         print(f"❌ Error processing Pi report: {str(e)}")
-        import traceback
         traceback.print_exc()
         return {
             "success": False,
@@ -656,15 +787,24 @@ async def process_video(file: UploadFile = File(...)):
         frame_skip = 3
         print(f"⚡ Fast mode: Processing every {frame_skip} frames (3x faster)")
         
-        # Create video writer
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
+        # Create video writer (hardware H.264 via ffmpeg when available)
+        out = open_video_writer(output_path, fps, (width, height))
         
         frame_count = 0
         last_mask = None  # Cache last mask for skipped frames
+        mask_bool = None
+        has_soldiers = False
+        
+        # ⚡ OPTIMIZATION: Preallocate frame buffers once and reuse them for every frame
+        frame_buf = np.empty((height, width, 3), np.uint8)
+        rgb_buf = np.empty_like(frame_buf)
+        blend_buf = np.empty_like(frame_buf)
+        bgr_out_buf = np.empty_like(frame_buf)
+        red_layer = np.zeros_like(frame_buf)
+        red_layer[..., 2] = 255  # Red in BGR order
         
         while cap.isOpened():
-            ret, frame = cap.read()
+            ret, frame = cap.read(frame_buf)
             if not ret:
                 break
             
@@ -674,27 +814,25 @@ async def process_video(file: UploadFile = File(...)):
                 # ⚡ OPTIMIZATION: Only process every Nth frame
                 if frame_count % frame_skip == 1 or last_mask is None:
                     # Convert BGR to RGB for model
-                    frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                    pil_frame = Image.fromarray(frame_rgb)
+                    cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=rgb_buf)
                     
-                    # Run segmentation (ignore instances for video processing)
-                    mask, _ = model.predict(pil_frame)
+                    # Run segmentation off the event loop (ignore instances for video processing)
+                    mask, _ = await run_inference(model.predict, rgb_buf)
                     last_mask = mask  # Cache for next frames
                     
-                    # Create overlay
-                    overlay_pil = overlay_mask_on_image(pil_frame, last_mask, alpha=0.5)
-                else:
-                    # ⚡ Reuse last mask for skipped frames (much faster)
-                    frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                    pil_frame = Image.fromarray(frame_rgb)
-                    overlay_pil = overlay_mask_on_image(pil_frame, last_mask, alpha=0.5)
-                overlay_frame = np.array(overlay_pil)
-                
-                # Convert RGB back to BGR for video writer
-                overlay_bgr = cv2.cvtColor(overlay_frame, cv2.COLOR_RGB2BGR)
+                    # Precompute overlay selector once per keyframe and reuse it on skipped frames
+                    mask_bool = (mask == 1)[..., None]
+                    has_soldiers = bool(mask_bool.any())
                 
-                # Write frame
-                out.write(overlay_bgr)
+                if has_soldiers:
+                    # Blend red overlay directly in BGR
+                    cv2.addWeighted(frame, 0.5, red_layer, 0.5, 0, dst=blend_buf)
+                    np.copyto(bgr_out_buf, frame)
+                    np.copyto(bgr_out_buf, blend_buf, where=mask_bool)
+                    out.write(bgr_out_buf)
+                else:
+                    # Nothing detected - write the frame untouched
+                    out.write(frame)
                 
             except Exception as e:
                 print(f"⚠️ Warning: Error processing frame {frame_count}: {str(e)}")
@@ -726,7 +864,6 @@ async def process_video(file: UploadFile = File(...)):
     
     except Exception as e:
         print(f"❌ Video processing error: {str(e)}")
-        import traceback
         traceback.print_exc()
         return {
             "success": False,
@@ -778,7 +915,6 @@ async def moraqib_query(query: str = Form(...)):
     
     except Exception as e:
         print(f"❌ Moraqib endpoint error: {str(e)}")
-        import traceback
         traceback.print_exc()
         
         return {
@@ -795,9 +931,6 @@ async def fetch_image_base64(url: str):
     This bypasses CORS issues when generating PDFs
     """
     try:
-        import requests
-        from urllib.parse import urlparse, unquote
-        
         print(f"Fetching image from URL: {url}")
         
         # Extract path from full URL if needed
@@ -815,19 +948,18 @@ async def fetch_image_base64(url: str):
             file_path = local_storage_handler.get_file_path(storage_path)
             
             if file_path and file_path.exists():
-                # Read the image file
-                with open(file_path, 'rb') as f:
-                    image_bytes = f.read()
+                # Read the image file without blocking the event loop
+                image_bytes = await asyncio.to_thread(file_path.read_bytes)
                 
                 # Convert to base64
-                image_base64 = base64.b64encode(image_bytes).decode('utf-8')
+                image_base64 = binascii.b2a_base64(image_bytes, newline=False).decode('ascii')
                 
                 # Create data URL
                 data_url = f"data:image/jpeg;base64,{image_base64}"
                 
                 print(f"Successfully fetched image from local storage, size: {len(image_base64)} bytes")
                 
-                return JSONResponse(content={
+                return ORJSONResponse(content={
                     "success": True,
                     "base64": data_url
                 })
@@ -836,11 +968,11 @@ async def fetch_image_base64(url: str):
         
         # Fallback to regular HTTP request for external URLs
         print("Using regular HTTP request...")
-        response = requests.get(url, timeout=10)
+        response = await httpx_client.get(url)
         response.raise_for_status()
         
         # Convert to base64
-        image_base64 = base64.b64encode(response.content).decode('utf-8')
+        image_base64 = binascii.b2a_base64(response.content, newline=False).decode('ascii')
         
         # Determine content type
         content_type = response.headers.get('Content-Type', 'image/jpeg')
@@ -850,24 +982,23 @@ async def fetch_image_base64(url: str):
         
         print(f"Successfully fetched image, size: {len(image_base64)} bytes")
         
-        return JSONResponse(content={
+        return ORJSONResponse(content={
             "success": True,
             "base64": data_url
         })
         
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         print(f"Error fetching image: {str(e)}")
-        import traceback
         traceback.print_exc()
         raise HTTPException(status_code=400, detail=f"Failed to fetch image: {str(e)}")
     except Exception as e:
         print(f"Unexpected error: {str(e)}")
-        import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Server error: {str(e)}")
 
 if __name__ == "__main__":
     import uvicorn
     print("🚀 Starting Mirqab Backend Server...")
+    # loop/http default to "auto": uvloop and httptools when installed (uvicorn[standard], not on Windows)
     uvicorn.run(app, host="0.0.0.0", port=8000)
 
@@ -5,24 +5,250 @@ Keras-based segmentation with camouflage detection
 
 import tensorflow as tf
 from tensorflow import keras
-from PIL import Image
 import numpy as np
 import cv2
+import os
+import threading
+import time
+import traceback
 from pathlib import Path
 
+# Optional TensorRT runtime (NVIDIA GPUs) - falls back to Keras when missing
+try:
+    import tensorrt as trt
+    import pycuda.driver as cuda
+    TENSORRT_AVAILABLE = True
+except ImportError:
+    TENSORRT_AVAILABLE = False
+
+# Optional Keras -> ONNX exporter (needed by the TensorRT and ONNX Runtime paths)
+try:
+    import tf2onnx
+    TF2ONNX_AVAILABLE = True
+except ImportError:
+    TF2ONNX_AVAILABLE = False
+
+# Optional ONNX Runtime (CUDA / TensorRT / OpenVINO / CoreML execution providers)
+try:
+    import onnxruntime as ort
+    ONNXRUNTIME_AVAILABLE = True
+except ImportError:
+    ONNXRUNTIME_AVAILABLE = False
+
+# Set USE_TENSORRT=false to force the plain Keras path on GPU machines
+USE_TENSORRT = os.getenv("USE_TENSORRT", "true").lower() == "true"
+
+# Set USE_ONNXRUNTIME=false to skip ONNX Runtime and run the model through TensorFlow
+USE_ONNXRUNTIME = os.getenv("USE_ONNXRUNTIME", "true").lower() == "true"
+
+# ONNX Runtime execution providers in order of preference (unavailable ones are skipped)
+ORT_PROVIDERS = [
+    ('TensorrtExecutionProvider', {'trt_fp16_enable': True}),
+    'CUDAExecutionProvider',
+    'OpenVINOExecutionProvider',
+    'CoreMLExecutionProvider',
+    'CPUExecutionProvider',
+]
+
+# Set USE_TFLITE_INT8=true to try INT8 TFLite inference on CPU-only machines
+USE_TFLITE_INT8 = os.getenv("USE_TFLITE_INT8", "false").lower() == "true"
+
+# Minimum mask IoU against the FP32 model on the calibration set to accept INT8
+TFLITE_MIN_IOU = float(os.getenv("TFLITE_MIN_IOU", "0.9"))
+
+# Previously saved upload images used as the INT8 calibration set
+CALIBRATION_DIR = Path(__file__).parent / "storage" / "reports"
+CALIBRATION_SAMPLES = 100
+
+# uint8 probability (0-255) -> class id; matches `prob > 0.5` (127.5 rounds up to 128)
+_THRESH_LUT = np.concatenate([np.zeros(128, np.uint8), np.ones(128, np.uint8)])
+
+
+class TensorRTEngine:
+    """
+    Serialized TensorRT engine with persistent pinned host / device buffers
+    allocated once and reused for every call.
+    Owns its own CUDA context so it can be driven from any worker thread.
+    """
+    
+    def __init__(self, engine_path: Path):
+        cuda.init()
+        self._cuda_ctx = cuda.Device(0).make_context()
+        self._lock = threading.Lock()
+        try:
+            logger = trt.Logger(trt.Logger.WARNING)
+            with open(engine_path, 'rb') as f, trt.Runtime(logger) as runtime:
+                self.engine = runtime.deserialize_cuda_engine(f.read())
+            if self.engine is None:
+                raise RuntimeError(f"Failed to deserialize TensorRT engine: {engine_path}")
+            self.context = self.engine.create_execution_context()
+            
+            # Named I/O tensor API (TensorRT 8.5+, the only one left in TensorRT 10)
+            names = [self.engine.get_tensor_name(i) for i in range(self.engine.num_io_tensors)]
+            input_name = next(n for n in names if self.engine.get_tensor_mode(n) == trt.TensorIOMode.INPUT)
+            output_name = next(n for n in names if self.engine.get_tensor_mode(n) == trt.TensorIOMode.OUTPUT)
+            input_shape = tuple(self.engine.get_tensor_shape(input_name))
+            output_shape = tuple(self.engine.get_tensor_shape(output_name))
+            self._h_in = cuda.pagelocked_empty(input_shape, np.float32)
+            self._h_out = cuda.pagelocked_empty(output_shape, np.float32)
+            self._d_in = cuda.mem_alloc(self._h_in.nbytes)
+            self._d_out = cuda.mem_alloc(self._h_out.nbytes)
+            self.context.set_tensor_address(input_name, int(self._d_in))
+            self.context.set_tensor_address(output_name, int(self._d_out))
+            self._stream = cuda.Stream()
+            self._pinned_inputs = set()
+        except Exception:
+            # Release the context so a failed load does not leak it
+            self._cuda_ctx.pop()
+            self._cuda_ctx.detach()
+            raise
+        self._cuda_ctx.pop()
+    
+    def allocate_input(self) -> np.ndarray:
+        """
+        Allocate a pinned host input buffer that infer() can upload directly,
+        so callers can preprocess straight into page-locked memory.
+        """
+        self._cuda_ctx.push()
+        try:
+            buffer = cuda.pagelocked_empty(self._h_in.shape, np.float32)
+        finally:
+            self._cuda_ctx.pop()
+        self._pinned_inputs.add(buffer.ctypes.data)
+        return buffer
+    
+    @staticmethod
+    def build(onnx_path: Path, engine_path: Path):
+        """Build an FP16 engine from an ONNX file and serialize it to engine_path"""
+        logger = trt.Logger(trt.Logger.WARNING)
+        builder = trt.Builder(logger)
+        # Networks are always explicit-batch in TensorRT 10; older versions need the flag
+        if int(trt.__version__.split('.')[0]) >= 10:
+            network_flags = 0
+        else:
+            network_flags = 1 << int(trt.NetworkDefinitionCreationFlag.EXPLICIT_BATCH)
+        network = builder.create_network(network_flags)
+        parser = trt.OnnxParser(network, logger)
+        
+        with open(onnx_path, 'rb') as f:
+            if not parser.parse(f.read()):
+                errors = [str(parser.get_error(i)) for i in range(parser.num_errors)]
+                raise RuntimeError(f"Failed to parse ONNX model: {errors}")
+        
+        config = builder.create_builder_config()
+        config.set_memory_pool_limit(trt.MemoryPoolType.WORKSPACE, 1 << 30)
+        if builder.platform_has_fast_fp16:
+            config.set_flag(trt.BuilderFlag.FP16)
+        
+        serialized = builder.build_serialized_network(network, config)
+        if serialized is None:
+            raise RuntimeError("TensorRT engine build failed")
+        with open(engine_path, 'wb') as f:
+            f.write(serialized)
+    
+    def infer(self, input_tensor: np.ndarray) -> np.ndarray:
+        with self._lock:
+            self._cuda_ctx.push()
+            try:
+                if input_tensor.ctypes.data in self._pinned_inputs:
+                    # Already in page-locked memory - upload without a staging copy
+                    host_in = input_tensor
+                else:
+                    np.copyto(self._h_in, input_tensor)
+                    host_in = self._h_in
+                cuda.memcpy_htod_async(self._d_in, host_in, self._stream)
+                self.context.execute_async_v3(self._stream.handle)
+                cuda.memcpy_dtoh_async(self._h_out, self._d_out, self._stream)
+                self._stream.synchronize()
+                return self._h_out.copy()
+            finally:
+                self._cuda_ctx.pop()
+
+
+class TFLiteRunner:
+    """Thread-safe wrapper around a quantized TFLite interpreter (float in, float out)"""
+    
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+        self._lock = threading.Lock()
+        input_details = interpreter.get_input_details()[0]
+        output_details = interpreter.get_output_details()[0]
+        self._in_idx = input_details['index']
+        self._out_idx = output_details['index']
+        self._in_scale, self._in_zero = input_details['quantization']
+        self._out_scale, self._out_zero = output_details['quantization']
+    
+    def infer(self, input_tensor: np.ndarray) -> np.ndarray:
+        input_u8 = np.clip(np.rint(input_tensor / self._in_scale + self._in_zero), 0, 255).astype(np.uint8)
+        with self._lock:
+            self.interpreter.set_tensor(self._in_idx, input_u8)
+            self.interpreter.invoke()
+            output = self.interpreter.get_tensor(self._out_idx)
+        return (output.astype(np.float32) - self._out_zero) * self._out_scale
+
+
+class OnnxRuntimeRunner:
+    """ONNX Runtime session on the best available execution provider (float in, float out)"""
+    
+    def __init__(self, onnx_path: Path):
+        available = set(ort.get_available_providers())
+        providers = [
+            p for p in ORT_PROVIDERS
+            if (p[0] if isinstance(p, tuple) else p) in available
+        ]
+        # InferenceSession.run is thread-safe, no lock needed
+        self._sess = ort.InferenceSession(str(onnx_path), providers=providers)
+        self._in_name = self._sess.get_inputs()[0].name
+        self.provider = self._sess.get_providers()[0]
+    
+    def infer(self, input_tensor: np.ndarray) -> np.ndarray:
+        return self._sess.run(None, {self._in_name: input_tensor})[0]
+
+
+def _time_call(func, arg, runs: int = 5) -> float:
+    """Median wall time of func(arg) after one warmup call"""
+    func(arg)
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func(arg)
+        timings.append(time.perf_counter() - start)
+    return sorted(timings)[runs // 2]
+
+
 class SegmentationModel:
-    def __init__(self, model_path: str = "../resnet_finetuned_best.h5"):
+    def __init__(self, model_path: str = "../resnet_finetuned_best.h5", intra_op_threads: int = None):
         self.model_path = Path(model_path)
         self.model = None
+        self._infer = None
+        self._thread_local = threading.local()
+        self._trt_engine = None
+        self._tflite = None
+        self._ort = None
+        self.intra_op_threads = intra_op_threads
         self.class_names = {0: "background", 1: "camouflage_soldier"}
         self.num_classes = 2  # background + camouflage_soldier
         self._loaded = False
         self.input_size = (256, 256)  # Model input size
         
+        # Limit TensorFlow's CPU thread pools (must happen before the runtime starts)
+        if intra_op_threads:
+            try:
+                tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+                tf.config.threading.set_inter_op_parallelism_threads(max(1, intra_op_threads // 2))
+            except RuntimeError as e:
+                print(f"⚠️ Could not set TensorFlow thread limits: {e}")
+        
         # Check for GPU availability
         gpus = tf.config.list_physical_devices('GPU')
         if gpus:
             print(f"Using GPU: {gpus}")
+            # Allocate GPU memory on demand instead of reserving it all on first use
+            for gpu in gpus:
+                try:
+                    tf.config.experimental.set_memory_growth(gpu, True)
+                except RuntimeError as e:
+                    print(f"⚠️ Could not enable GPU memory growth: {e}")
         else:
             print("Using CPU")
         
@@ -46,123 +272,369 @@ class SegmentationModel:
                 metrics=['accuracy']
             )
             
+            # Persistent compiled inference function for the Keras path
+            self._infer = self._build_infer_fn()
+            
+            # Prefer a TensorRT engine on NVIDIA GPUs (Keras stays as the fallback)
+            has_gpu = bool(tf.config.list_physical_devices('GPU'))
+            if TENSORRT_AVAILABLE and TF2ONNX_AVAILABLE and USE_TENSORRT and has_gpu:
+                self._trt_engine = self._load_tensorrt_engine()
+            
+            # Otherwise serve the exported graph through ONNX Runtime's fused EP kernels
+            if self._trt_engine is None and ONNXRUNTIME_AVAILABLE and USE_ONNXRUNTIME:
+                self._ort = self._load_onnxruntime()
+            
+            # On CPU-only hosts use an INT8 TFLite model when it is actually faster
+            if not has_gpu and USE_TFLITE_INT8:
+                self._tflite = self._load_tflite_int8()
+            
+            # Pay cuDNN autotuning / engine initialization now, not on the first request
+            self._warmup()
+            
             self._loaded = True
             print("Keras ResNet model loaded successfully!")
-            print(f"   - Model type: Keras/TensorFlow")
+            print(f"   - Model type: {self._backend_name()}")
             print(f"   - Input shape: {self.model.input_shape}")
             print(f"   - Output shape: {self.model.output_shape}")
             print(f"   - Number of classes: {self.num_classes}")
             print(f"   - Class names: {self.class_names}")
         except Exception as e:
             print(f"Error loading model: {str(e)}")
-            import traceback
             traceback.print_exc()
             raise
     
+    def _warmup(self, runs: int = 2):
+        """Run dummy forward passes through the active backend and log their latency"""
+        dummy = np.zeros((1, *self.input_size, 3), np.float32)
+        for run in range(runs):
+            start = time.perf_counter()
+            self._run_model(dummy)
+            label = "first" if run == 0 else "steady"
+            print(f"   - Warmup ({label}): {(time.perf_counter() - start) * 1000:.1f} ms")
+    
+    def _is_fresh(self, artifact_path: Path) -> bool:
+        """True if a cached model artifact exists and was built after the current .h5 file"""
+        return artifact_path.exists() and artifact_path.stat().st_mtime >= self.model_path.stat().st_mtime
+    
+    def _export_onnx(self) -> Path:
+        """Export the Keras model to ONNX next to the .h5 file (again whenever the .h5 changes)"""
+        onnx_path = self.model_path.with_suffix('.onnx')
+        if not self._is_fresh(onnx_path):
+            print(f"   Exporting ONNX model to {onnx_path}...")
+            input_signature = (tf.TensorSpec((1, *self.input_size, 3), tf.float32, name="input"),)
+            tf2onnx.convert.from_keras(
+                self.model, input_signature=input_signature, opset=17, output_path=str(onnx_path)
+            )
+        return onnx_path
+    
+    def _load_tensorrt_engine(self):
+        """Load the cached TensorRT engine, (re)building it from ONNX when missing, stale or unusable"""
+        try:
+            engine_path = self.model_path.with_suffix('.fp16.engine')
+            built = False
+            if not self._is_fresh(engine_path):
+                print(f"   Building TensorRT engine (first run, this can take a few minutes)...")
+                TensorRTEngine.build(self._export_onnx(), engine_path)
+                built = True
+            try:
+                engine = TensorRTEngine(engine_path)
+            except RuntimeError as e:
+                if built:
+                    raise
+                # Cached engine from another TensorRT version / GPU - rebuild it once
+                print(f"⚠️ Cached TensorRT engine unusable ({str(e)}), rebuilding...")
+                TensorRTEngine.build(self._export_onnx(), engine_path)
+                engine = TensorRTEngine(engine_path)
+            print(f"   TensorRT engine ready: {engine_path}")
+            return engine
+        except Exception as e:
+            print(f"⚠️ TensorRT unavailable, using Keras inference: {str(e)}")
+            traceback.print_exc()
+            return None
+    
+    def _load_onnxruntime(self):
+        """Open an ONNX Runtime session on the exported model (exported on first run)"""
+        try:
+            onnx_path = self.model_path.with_suffix('.onnx')
+            if not self._is_fresh(onnx_path):
+                if not TF2ONNX_AVAILABLE:
+                    print("   tf2onnx not installed and no up-to-date ONNX model found, skipping ONNX Runtime")
+                    return None
+                onnx_path = self._export_onnx()
+            runner = OnnxRuntimeRunner(onnx_path)
+            print(f"   ONNX Runtime session ready: {onnx_path} ({runner.provider})")
+            return runner
+        except Exception as e:
+            print(f"⚠️ ONNX Runtime unavailable, using Keras inference: {str(e)}")
+            traceback.print_exc()
+            return None
+    
+    def _representative_dataset(self):
+        """Yield preprocessed calibration tiles from previously stored report images"""
+        image_paths = sorted(CALIBRATION_DIR.glob("*/original_*.jpg"))[:CALIBRATION_SAMPLES]
+        for image_path in image_paths:
+            image = cv2.imread(str(image_path), cv2.IMREAD_COLOR)
+            if image is None:
+                continue
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+            image = cv2.resize(image, self.input_size, interpolation=cv2.INTER_AREA)
+            yield [image[np.newaxis].astype(np.float32) / 255.0]
+    
+    def _mask_iou(self, candidate_fn, reference_fn) -> float:
+        """Foreground IoU of candidate_fn vs reference_fn masks over the calibration set"""
+        intersection = union = 0
+        for (tile,) in self._representative_dataset():
+            # Comparisons copy out of _to_segmentation_maps' scratch buffer
+            candidate = self._to_segmentation_maps(candidate_fn(tile)) == 1
+            reference = self._to_segmentation_maps(reference_fn(tile)) == 1
+            intersection += np.count_nonzero(candidate & reference)
+            union += np.count_nonzero(candidate | reference)
+        # Both empty everywhere counts as full agreement
+        return intersection / union if union else 1.0
+    
+    def _load_tflite_int8(self):
+        """
+        Load (or convert on first run) a full-integer INT8 TFLite model.
+        Only kept if its masks agree with the FP32 model on the calibration set
+        (IoU >= TFLITE_MIN_IOU) and it beats the FP32 backend on this host, since
+        INT8 can be slower when the runtime lacks matching SIMD kernels.
+        """
+        try:
+            tflite_path = self.model_path.with_name(f"{self.model_path.stem}_int8.tflite")
+            if not self._is_fresh(tflite_path):
+                if not any(CALIBRATION_DIR.glob("*/original_*.jpg")):
+                    print("   No calibration images found, skipping INT8 TFLite conversion")
+                    return None
+                print(f"   Converting INT8 TFLite model to {tflite_path}...")
+                converter = tf.lite.TFLiteConverter.from_keras_model(self.model)
+                converter.optimizations = [tf.lite.Optimize.DEFAULT]
+                converter.representative_dataset = self._representative_dataset
+                converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+                converter.inference_input_type = tf.uint8
+                converter.inference_output_type = tf.uint8
+                tflite_path.write_bytes(converter.convert())
+            
+            interpreter = tf.lite.Interpreter(
+                model_path=str(tflite_path),
+                num_threads=self.intra_op_threads or os.cpu_count()
+            )
+            interpreter.allocate_tensors()
+            tflite = TFLiteRunner(interpreter)
+            
+            # Accuracy check: INT8 masks must match the FP32 masks on the calibration set
+            iou = self._mask_iou(tflite.infer, self._run_model)
+            print(f"   INT8 TFLite mask IoU vs FP32: {iou:.3f}")
+            if iou < TFLITE_MIN_IOU:
+                print(f"   INT8 TFLite IoU below {TFLITE_MIN_IOU}, keeping {self._backend_name()}")
+                return None
+            
+            # Runtime check: keep INT8 only if it is faster than the FP32 backend here
+            dummy = np.zeros((1, *self.input_size, 3), np.float32)
+            int8_time = _time_call(tflite.infer, dummy)
+            fp32_time = _time_call(self._run_model, dummy)
+            print(f"   INT8 TFLite: {int8_time * 1000:.1f} ms, FP32 {self._backend_name()}: {fp32_time * 1000:.1f} ms")
+            if int8_time >= fp32_time:
+                print(f"   INT8 TFLite is not faster on this CPU, keeping {self._backend_name()}")
+                return None
+            return tflite
+        except Exception as e:
+            print(f"⚠️ INT8 TFLite unavailable, using Keras inference: {str(e)}")
+            traceback.print_exc()
+            return None
+    
+    def _backend_name(self) -> str:
+        if self._trt_engine is not None:
+            return "TensorRT (FP16)"
+        if self._tflite is not None:
+            return "TFLite (INT8)"
+        if self._ort is not None:
+            return f"ONNX Runtime ({self._ort.provider})"
+        return "Keras/TensorFlow"
+    
+    def _build_infer_fn(self):
+        """
+        Compile the Keras forward pass into a persistent tf.function (XLA when supported)
+        so per-call inference skips Model.predict's tf.data / Python dispatch overhead.
+        """
+        input_signature = [tf.TensorSpec([None, *self.input_size, 3], tf.float32)]
+        dummy = tf.zeros([1, *self.input_size, 3], tf.float32)
+        try:
+            infer = tf.function(lambda x: self.model(x, training=False),
+                                jit_compile=True, input_signature=input_signature)
+            infer(dummy)  # Trigger XLA compilation
+            print("   - XLA compiled inference graph ready")
+            return infer
+        except Exception as e:
+            print(f"⚠️ XLA compilation failed ({str(e)}), using tf.function without jit")
+            infer = tf.function(lambda x: self.model(x, training=False), input_signature=input_signature)
+            infer(dummy)
+            return infer
+    
+    def _run_model(self, input_tensor: np.ndarray) -> np.ndarray:
+        """Run the fastest available inference backend on a preprocessed batch"""
+        runner = self._trt_engine or self._tflite or self._ort
+        if runner is not None:
+            # Fixed batch-1 backends - run batches item by item
+            if len(input_tensor) == 1:
+                return runner.infer(input_tensor)
+            return np.concatenate([runner.infer(item[np.newaxis]) for item in input_tensor])
+        return self._infer(tf.constant(input_tensor)).numpy()
+    
     def is_loaded(self):
         return self._loaded
     
+    def _input_buffer(self) -> np.ndarray:
+        """Per-thread preallocated (1, H, W, 3) float32 input tensor reused across calls"""
+        buffer = getattr(self._thread_local, 'input_tensor', None)
+        if buffer is None:
+            if self._trt_engine is not None:
+                # Pinned memory so the H2D upload needs no extra copy
+                buffer = self._trt_engine.allocate_input()
+            else:
+                buffer = np.empty((1, *self.input_size, 3), np.float32)
+            self._thread_local.input_tensor = buffer
+        return buffer
+    
+    def _thread_buffer(self, name: str, shape, dtype=np.uint8) -> np.ndarray:
+        """Per-thread scratch array, reallocated only when the requested shape changes"""
+        buffer = getattr(self._thread_local, name, None)
+        if buffer is None or buffer.shape != shape:
+            buffer = np.empty(shape, dtype)
+            setattr(self._thread_local, name, buffer)
+        return buffer
+    
+    def _threshold(self, probs: np.ndarray) -> np.ndarray:
+        """
+        Threshold (N, H, W) float probabilities at 0.5 into uint8 class maps.
+        Quantizes to uint8 once, then a single SIMD table lookup over bytes.
+        """
+        n, h, w = probs.shape
+        flat = np.ascontiguousarray(probs, dtype=np.float32).reshape(n * h, w)
+        prob_u8 = self._thread_buffer('prob_u8', (n * h, w))
+        seg_u8 = self._thread_buffer('seg_u8', (n * h, w))
+        cv2.convertScaleAbs(flat, prob_u8, 255.0, 0.0)
+        cv2.LUT(prob_u8, _THRESH_LUT, seg_u8)
+        return seg_u8.reshape(n, h, w)
+    
+    def _image_size(self, image):
+        """(width, height) of a PIL Image or numpy array"""
+        if isinstance(image, np.ndarray):
+            return image.shape[1], image.shape[0]
+        return image.size
+    
+    def _preprocess(self, image, out: np.ndarray = None) -> np.ndarray:
+        """
+        Resize to model input size and normalize to [0, 1] float32 (H, W, 3).
+        Writes into `out` when given (e.g. one slot of a preallocated batch).
+        """
+        # Zero-copy view of PIL images; OpenCV does the (SIMD) resize for both input types
+        arr = np.asarray(image, dtype=np.uint8)
+        # Area filter whenever either side shrinks (input_size is (width, height))
+        dst_w, dst_h = self.input_size
+        shrinks = arr.shape[0] > dst_h or arr.shape[1] > dst_w
+        interpolation = cv2.INTER_AREA if shrinks else cv2.INTER_LINEAR
+        img_resized = cv2.resize(arr, self.input_size, interpolation=interpolation)
+        
+        # Normalize to [0, 1] in a single pass
+        return np.multiply(img_resized, np.float32(1.0 / 255.0), out=out, dtype=np.float32)
+    
+    def _to_segmentation_maps(self, output: np.ndarray) -> np.ndarray:
+        """Turn a batched model output into uint8 class maps (N, height, width)"""
+        # Output shape: (N, height, width, 1) for binary segmentation
+        # The model outputs probabilities in a single channel
+        if len(output.shape) == 4 and output.shape[-1] == 1:
+            # Single channel binary segmentation - squeeze and threshold
+            # (returns a per-thread scratch buffer; callers resize it into a new array)
+            return self._threshold(output[..., 0])
+        elif len(output.shape) == 4 and output.shape[-1] > 1:
+            # Multi-class segmentation - use argmax
+            return np.argmax(output, axis=-1).astype(np.uint8)
+        # Already 2D per image
+        return (output > 0.5).astype(np.uint8)
+    
+    def _resize_to_original(self, segmentation_map: np.ndarray, original_width: int, original_height: int) -> np.ndarray:
+        """Resize a class map back to the original image size"""
+        return cv2.resize(
+            segmentation_map,
+            (original_width, original_height),
+            interpolation=cv2.INTER_NEAREST
+        )
+    
     def predict(self, image):
         """
-        Predict segmentation mask for a single image.
-        Returns binary mask and segmentation map.
+        Predict segmentation mask for a single image (PIL Image or RGB numpy array).
+        Returns binary mask and segmentation map (the same uint8 array for this binary model).
         """
         if not self._loaded:
             raise RuntimeError("Model not loaded. Call load_model() first.")
         
+        # Get original dimensions
+        original_width, original_height = self._image_size(image)
+        
         try:
-            # Get original dimensions
-            original_width, original_height = image.size
-            
-            # Preprocess image for ResNet
-            # Resize to model input size
-            img_resized = image.resize(self.input_size, Image.Resampling.LANCZOS)
-            
-            # Convert to numpy array and normalize
-            img_array = np.array(img_resized).astype(np.float32)
-            img_array = img_array / 255.0  # Normalize to [0, 1]
-            
-            # Add batch dimension
-            input_tensor = np.expand_dims(img_array, axis=0)
+            # Preprocess image for ResNet straight into the reused batch-1 input buffer
+            input_tensor = self._input_buffer()
+            self._preprocess(image, out=input_tensor[0])
             
             # Run inference
-            output = self.model.predict(input_tensor, verbose=0)
-            
-            # Get segmentation map (class predictions for each pixel)
-            # Output shape: (1, height, width, 1) for binary segmentation
-            # The model outputs probabilities in a single channel
-            if len(output.shape) == 4 and output.shape[-1] == 1:
-                # Single channel binary segmentation - squeeze and threshold
-                prob_map = output[0, :, :, 0]  # Remove batch and channel dims
-                segmentation_map = (prob_map > 0.5).astype(np.uint8)
-            elif len(output.shape) == 4 and output.shape[-1] > 1:
-                # Multi-class segmentation - use argmax
-                segmentation_map = np.argmax(output[0], axis=-1).astype(np.uint8)
-            else:
-                # Already 2D
-                segmentation_map = (output[0] > 0.5).astype(np.uint8)
-            
-            # Resize to original image size
-            segmentation_map = cv2.resize(
-                segmentation_map,
-                (original_width, original_height),
-                interpolation=cv2.INTER_NEAREST
+            output = self._run_model(input_tensor)
+            
+            segmentation_map = self._resize_to_original(
+                self._to_segmentation_maps(output)[0], original_width, original_height
             )
             
             # For binary segmentation, the mask IS the soldier detection (1 = soldier, 0 = background)
-            binary_mask = segmentation_map.astype(np.uint8)
-            
-            return binary_mask, segmentation_map
+            # Both return values are the same uint8 array - no full-resolution copy
+            return segmentation_map, segmentation_map
             
         except Exception as e:
             print(f"Error in prediction: {str(e)}")
-            import traceback
             traceback.print_exc()
             # Return empty masks on error
             empty_mask = np.zeros((original_height, original_width), dtype=np.uint8)
-            empty_seg_map = np.zeros((original_height, original_width), dtype=np.uint8)
-            return empty_mask, empty_seg_map
+            return empty_mask, empty_mask
     
     def predict_with_details(self, image):
         """
         Predict with detailed instance extraction using connected components.
         Returns mask, instances, and counts.
+        Each instance "mask" covers only its bbox region (bbox[1]:bbox[3], bbox[0]:bbox[2]).
         """
-        binary_mask, segmentation_map = self.predict(image)
+        binary_mask, _ = self.predict(image)
         
         detections = []
         soldier_count = 0
         
+        # Minimum area threshold to filter noise
+        min_area = 100
+        
         # Extract individual soldier instances using connected components
-        if np.any(binary_mask > 0):
-            num_labels, labels, stats, centroids = cv2.connectedComponentsWithStats(
-                binary_mask, connectivity=8
+        # (Bolelli/Spaghetti CCL - OpenCV's SIMD-accelerated labeling path).
+        # Skipped when fewer than min_area pixels are set: no component could pass the filter,
+        # and countNonZero is a single allocation-free pass over the bytes.
+        if cv2.countNonZero(binary_mask) >= min_area:
+            num_labels, labels, stats, centroids = cv2.connectedComponentsWithStatsWithAlgorithm(
+                binary_mask, 8, cv2.CV_32S, cv2.CCL_BOLELLI
             )
             
-            # Minimum area threshold to filter noise
-            min_area = 100
+            # Filter all components at once
+            keep = np.nonzero(stats[1:, cv2.CC_STAT_AREA] >= min_area)[0] + 1  # Skip background (label 0)
             
-            for i in range(1, num_labels):  # Skip background (label 0)
-                area = stats[i, cv2.CC_STAT_AREA]
+            for i in keep.tolist():
+                x, y, w, h = stats[i, :4].tolist()
+                
+                # Create instance mask cropped to the bbox - O(w*h) instead of a full-image scan
+                instance_mask = (labels[y:y + h, x:x + w] == i).astype(np.uint8)
                 
-                if area >= min_area:
-                    x = int(stats[i, cv2.CC_STAT_LEFT])
-                    y = int(stats[i, cv2.CC_STAT_TOP])
-                    w = int(stats[i, cv2.CC_STAT_WIDTH])
-                    h = int(stats[i, cv2.CC_STAT_HEIGHT])
-                    
-                    # Create instance mask
-                    instance_mask = (labels == i).astype(np.uint8)
-                    
-                    detections.append({
-                        "bbox": [x, y, x + w, y + h],
-                        "score": 0.95,
-                        "confidence": 0.95,
-                        "mask": instance_mask,
-                        "class_id": 1,
-                        "class_name": "camouflage_soldier"
-                    })
-                    soldier_count += 1
+                detections.append({
+                    "bbox": [x, y, x + w, y + h],
+                    "score": 0.95,
+                    "confidence": 0.95,
+                    "mask": instance_mask,
+                    "class_id": 1,
+                    "class_name": "camouflage_soldier"
+                })
+            soldier_count = len(detections)
         
         return {
             "mask": binary_mask,
@@ -181,9 +653,28 @@ class SegmentationModel:
         if not self._loaded:
             raise RuntimeError("Model not loaded. Call load_model() first.")
         
-        results = []
-        for image in images:
-            mask, seg_map = self.predict(image)
-            results.append((mask, seg_map))
+        if not images:
+            return []
         
-        return results
+        try:
+            # Preprocess straight into one preallocated batch tensor
+            batch = np.empty((len(images), *self.input_size, 3), np.float32)
+            for i, image in enumerate(images):
+                self._preprocess(image, out=batch[i])
+            
+            # Single inference call, vectorized thresholding over the whole batch
+            seg_maps = self._to_segmentation_maps(self._run_model(batch))
+            
+            # Per-item resize is unavoidable since original sizes differ
+            results = []
+            for image, seg_map in zip(images, seg_maps):
+                width, height = self._image_size(image)
+                seg_map = self._resize_to_original(seg_map, width, height)
+                results.append((seg_map, seg_map))
+            
+            return results
+        
+        except Exception as e:
+            # One bad image must not fail the whole batch - predict() handles errors per image
+            print(f"Error in batch prediction, retrying image by image: {str(e)}")
+            return [self.predict(image) for image in images]
@@ -5,23 +5,242 @@ Handles complex queries about detection reports with smart data retrieval
 
 import os
 import json
+import asyncio
+import hashlib
+import time
+import httpx
 from datetime import datetime, timedelta
+from functools import lru_cache
 from typing import Dict, List, Optional, Tuple
 from dotenv import load_dotenv
 import re
+import math
+import heapq
+import traceback
+from collections import Counter, OrderedDict
 
 # Load environment variables
 load_dotenv()
 
 # Import OpenAI
 try:
-    from openai import OpenAI
+    from openai import AsyncOpenAI
     OPENAI_AVAILABLE = True
 except ImportError:
     OPENAI_AVAILABLE = False
     print("⚠️ OpenAI not installed. Install with: pip install openai")
 
 
+# Precompiled query patterns
+_ORDINAL_RE = re.compile(r'(\d+)(?:st|nd|rd|th) report')
+_LAST_N_REPORTS_RE = re.compile(r'last (\d+) reports?')
+_LAST_N_DAYS_RE = re.compile(r'last (\d+) days?')
+_DEVICE_RE = re.compile(r'pi-\d{3}', re.IGNORECASE)
+_TOKEN_RE = re.compile(r'\w+')
+
+# Set RAG_ANSWER_CACHE=false to always call the LLM (e.g. when measuring its latency)
+RAG_ANSWER_CACHE = os.getenv("RAG_ANSWER_CACHE", "true").lower() == "true"
+ANSWER_CACHE_SIZE = 256
+
+# Report fields indexed for BM25 reranking
+_RANK_FIELDS = ('environment', 'attire_and_camouflage', 'equipment', 'report_id')
+
+# Intents whose answers depend on every retrieved report (counts, ordering, summaries, lists)
+_UNRANKED_INTENTS = frozenset({'aggregation', 'latest', 'summary', 'filtering'})
+
+# Temporal contexts that already select exactly the reports the question is about
+_UNRANKED_TEMPORAL_TYPES = frozenset({'ordinal', 'last_n', 'date_range'})
+
+
+def _keyword_regex(keywords: List[str]) -> "re.Pattern":
+    """Compile substring keywords into one alternation regex (single scan per query)"""
+    return re.compile('|'.join(re.escape(kw) for kw in sorted(keywords, key=len, reverse=True)))
+
+
+# Intent keyword patterns, checked in priority order
+_INTENT_PATTERNS = [
+    # Aggregation patterns
+    ('aggregation', 0.9, _keyword_regex([
+        'how many', 'count', 'total', 'average', 'avg', 'sum',
+        'number of', 'calculate', 'statistics', 'stat'
+    ])),
+    # Latest/Last patterns
+    ('latest', 0.95, _keyword_regex([
+        'last report', 'latest', 'most recent', 'newest',
+        'last detection', 'recent report'
+    ])),
+    # Summary patterns
+    ('summary', 0.85, _keyword_regex([
+        'summary', 'summarize', 'describe', 'tell me about',
+        'what is', 'what was', 'explain', 'overview'
+    ])),
+    # Device-specific queries
+    ('device_query', 0.9, _keyword_regex([
+        'device', 'devices', 'pi-', 'raspberry', 'sensor'
+    ])),
+    # Filtering patterns
+    ('filtering', 0.8, _keyword_regex([
+        'show', 'list', 'find', 'search', 'get',
+        'from device', 'by device', 'where'
+    ])),
+]
+
+# Fixed time phrases, checked in priority order
+_LAST_REPORT_RE = _keyword_regex(['last report', 'latest report', 'most recent report'])
+_TIME_RE = re.compile(
+    r'(?P<today>today)|'
+    r'(?P<yesterday>yesterday)|'
+    r'(?P<week>last week|past week)|'
+    r'(?P<month>last month|past month)'
+)
+_TIME_SPECS = {
+    'today': ('today',),
+    'yesterday': ('yesterday',),
+    'week': ('days', 7),
+    'month': ('days', 30),
+}
+
+
+def _midnight(dt: datetime) -> datetime:
+    return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+# Resolve a date-range spec against the current time -> (start_date, end_date)
+_DATE_RANGE_RESOLVERS = {
+    'today': lambda now, spec: (_midnight(now), now),
+    'yesterday': lambda now, spec: (_midnight(now) - timedelta(days=1), _midnight(now)),
+    'days': lambda now, spec: (now - timedelta(days=spec[1]), now),
+}
+
+
+@lru_cache(maxsize=1024)
+def _classify_intent_cached(query_lower: str) -> Tuple[str, float]:
+    """Pure intent classification on a lower-cased query (memoized)"""
+    for intent_type, confidence, pattern in _INTENT_PATTERNS:
+        if pattern.search(query_lower):
+            return intent_type, confidence
+    
+    # Default to general query
+    return 'general', 0.5
+
+
+@lru_cache(maxsize=1024)
+def _parse_temporal_spec(query_lower: str) -> Tuple:
+    """
+    Parse time-related phrases into a symbolic spec (memoized).
+    The spec is resolved against the current time by the caller so cached
+    entries never go stale.
+    
+    Returns one of:
+        ('ordinal', n), ('last_n', n), ('today',), ('yesterday',), ('days', n), ('recent',)
+    """
+    # Matches: "1st report", "2nd report", "3rd report", "13th report", "13rd report" (typo)
+    ordinal_match = _ORDINAL_RE.search(query_lower)
+    if ordinal_match:
+        return ('ordinal', int(ordinal_match.group(1)))
+    
+    last_n_match = _LAST_N_REPORTS_RE.search(query_lower)
+    if last_n_match:
+        return ('last_n', int(last_n_match.group(1)))
+    
+    if _LAST_REPORT_RE.search(query_lower):
+        return ('last_n', 1)
+    
+    time_match = _TIME_RE.search(query_lower)
+    if time_match:
+        return _TIME_SPECS[time_match.lastgroup]
+    
+    days_match = _LAST_N_DAYS_RE.search(query_lower)
+    if days_match:
+        return ('days', int(days_match.group(1)))
+    
+    return ('recent',)
+
+
+@lru_cache(maxsize=1024)
+def _extract_device_id_cached(query_lower: str) -> Optional[str]:
+    """Device ID mentioned in a lower-cased query, if any (memoized)"""
+    # Look for patterns like "Pi-001", "device Pi-001", "from Pi-001"
+    device_match = _DEVICE_RE.search(query_lower)
+    if device_match:
+        return device_match.group(0).upper()
+    
+    # Look for "web upload" or "web-upload"
+    if 'web' in query_lower and ('upload' in query_lower or 'uploaded' in query_lower):
+        return "Web-Upload"
+    
+    return None
+
+
+def _format_report_block(i: int, report: Dict) -> str:
+    """Render one report for the LLM context as a single pre-built string"""
+    get = report.get
+    location = get('location') or {}
+    return (
+        f"\n{i}. Report: {get('report_id', 'Unknown')}\n"
+        f"   Time: {get('timestamp', 'Unknown')}\n"
+        f"   Soldiers: {get('soldier_count', 0)}\n"
+        f"   Environment: {get('environment', 'Unknown')}\n"
+        f"   Attire: {get('attire_and_camouflage', 'Unknown')}\n"
+        f"   Equipment: {get('equipment', 'Unknown')}\n"
+        f"   Device: {get('source_device_id', 'Unknown')}\n"
+        f"   Location: ({location.get('latitude', 0)}, {location.get('longitude', 0)})"
+    )
+
+
+def _tokenize(text: str) -> List[str]:
+    """Lower-cased word tokens used for BM25 scoring"""
+    return _TOKEN_RE.findall(text.lower())
+
+
+def _bm25_top_k(query: str, reports: List[Dict], k: int, k1: float = 1.5, b: float = 0.75) -> List[Dict]:
+    """
+    Rerank reports against the query with Okapi BM25 and keep the top-k
+    
+    Args:
+        query: User's question
+        reports: Retrieved reports (newest first)
+        k: Number of reports to keep
+        k1: BM25 term frequency saturation
+        b: BM25 length normalization
+    
+    Returns:
+        Top-k reports by relevance, in their original (recency) order
+    """
+    query_terms = set(_tokenize(query))
+    docs = [
+        Counter(_tokenize(' '.join(str(r.get(field) or '') for field in _RANK_FIELDS)))
+        for r in reports
+    ]
+    doc_lens = [sum(doc.values()) for doc in docs]
+    avg_len = (sum(doc_lens) / len(docs)) or 1.0
+    n_docs = len(docs)
+    
+    idf = {}
+    for term in query_terms:
+        df = sum(1 for doc in docs if term in doc)
+        if df:
+            idf[term] = math.log((n_docs - df + 0.5) / (df + 0.5) + 1.0)
+    
+    if not idf:
+        return reports[:k]
+    
+    scores = []
+    for doc, doc_len in zip(docs, doc_lens):
+        norm = k1 * (1 - b + b * doc_len / avg_len)
+        score = 0.0
+        for term, weight in idf.items():
+            tf = doc.get(term, 0)
+            if tf:
+                score += weight * tf * (k1 + 1) / (tf + norm)
+        scores.append(score)
+    
+    # Ties keep recency order (lower index wins); the kept reports are put back
+    # in retrieval order so the prompt's "newest first" still holds
+    top_idx = heapq.nlargest(k, range(n_docs), key=lambda i: (scores[i], -i))
+    return [reports[i] for i in sorted(top_idx)]
+
+
 class MoraqibRAG:
     """
     Advanced RAG system for querying detection reports
@@ -49,8 +268,29 @@ class MoraqibRAG:
             print("⚠️ Warning: OpenAI not available")
             self.client = None
         else:
-            self.client = OpenAI(api_key=self.api_key)
+            # Async client so concurrent queries don't block the event loop
+            # Pooled keep-alive HTTP/2 connections are reused across queries (no TLS handshake per call)
+            self.client = AsyncOpenAI(
+                api_key=self.api_key,
+                timeout=30,
+                http_client=httpx.AsyncClient(
+                    http2=True,
+                    timeout=30,
+                    limits=httpx.Limits(max_keepalive_connections=4, max_connections=16)
+                )
+            )
             print("✅ Moraqib RAG initialized with OpenAI GPT-4")
+        
+        # Only the most relevant reports are sent to the LLM (fewer prompt tokens)
+        self.max_reports_in_context = int(os.getenv("RAG_MAX_REPORTS_IN_CONTEXT", "10"))
+        
+        # LRU of answers keyed by (normalized query, retrieved report IDs)
+        self._answer_cache: "OrderedDict[tuple, str]" = OrderedDict()
+    
+    async def close(self):
+        """Close the underlying HTTP connection pool"""
+        if self.client:
+            await self.client.close()
     
     async def query(self, user_query: str) -> Dict:
         """
@@ -75,11 +315,22 @@ class MoraqibRAG:
         print(f"📅 Temporal context: {temporal_context}")
         
         # Step 3: Retrieve relevant reports
-        reports = self._retrieve_reports(intent, temporal_context, user_query)
+        reports = await self._retrieve_reports(intent, temporal_context, user_query)
         print(f"📚 Retrieved {len(reports)} reports")
+        retrieved_count = len(reports)
+        
+        # Step 3b: Keep only the top-K most relevant reports for the prompt
+        reports = self._rank_reports(user_query, reports, intent, temporal_context)
         
         # Step 4: Generate response using LLM with retrieved context
-        answer = await self._generate_answer(user_query, reports, intent, temporal_context)
+        # (same question over the same reports -> reuse the previous answer)
+        cache_key = self._answer_cache_key(user_query, reports)
+        answer = self._answer_cache.get(cache_key) if RAG_ANSWER_CACHE else None
+        if answer is not None:
+            self._answer_cache.move_to_end(cache_key)
+            print("⚡ Answer served from cache")
+        else:
+            answer = await self._generate_answer(user_query, reports, intent, temporal_context)
         
         # Extract report IDs used
         report_ids = [r.get('report_id', 'Unknown') for r in reports]
@@ -88,11 +339,19 @@ class MoraqibRAG:
             "success": True,
             "question": user_query,
             "answer": answer,
-            "reports_count": len(reports),
+            "reports_count": retrieved_count,
             "reports_used": report_ids[:10],  # Limit to first 10 for display
             "intent": intent['type']
         }
     
+    def _answer_cache_key(self, query: str, reports: List[Dict]) -> tuple:
+        """Cache key from the normalized query and the set of retrieved report IDs"""
+        ids = '|'.join(sorted(str(r.get('report_id', '')) for r in reports))
+        return (
+            query.strip().lower(),
+            hashlib.blake2b(ids.encode(), digest_size=16).digest()
+        )
+    
     def _classify_intent(self, query: str) -> Dict:
         """
         Classify the user's query intent
@@ -110,76 +369,10 @@ class MoraqibRAG:
         Returns:
             Dict with intent type and confidence
         """
-        query_lower = query.lower()
-        
-        # Aggregation patterns
-        aggregation_keywords = [
-            'how many', 'count', 'total', 'average', 'avg', 'sum',
-            'number of', 'calculate', 'statistics', 'stat'
-        ]
-        
-        # Summary patterns
-        summary_keywords = [
-            'summary', 'summarize', 'describe', 'tell me about',
-            'what is', 'what was', 'explain', 'overview'
-        ]
-        
-        # Latest/Last patterns
-        latest_keywords = [
-            'last report', 'latest', 'most recent', 'newest',
-            'last detection', 'recent report'
-        ]
-        
-        # Filtering patterns
-        filtering_keywords = [
-            'show', 'list', 'find', 'search', 'get',
-            'from device', 'by device', 'where'
-        ]
-        
-        # Device-specific queries
-        device_keywords = [
-            'device', 'devices', 'pi-', 'raspberry', 'sensor'
-        ]
-        
-        # Check for aggregation
-        if any(kw in query_lower for kw in aggregation_keywords):
-            return {
-                'type': 'aggregation',
-                'confidence': 0.9
-            }
-        
-        # Check for latest/last
-        if any(kw in query_lower for kw in latest_keywords):
-            return {
-                'type': 'latest',
-                'confidence': 0.95
-            }
-        
-        # Check for summary
-        if any(kw in query_lower for kw in summary_keywords):
-            return {
-                'type': 'summary',
-                'confidence': 0.85
-            }
-        
-        # Check for device queries
-        if any(kw in query_lower for kw in device_keywords):
-            return {
-                'type': 'device_query',
-                'confidence': 0.9
-            }
-        
-        # Check for filtering
-        if any(kw in query_lower for kw in filtering_keywords):
-            return {
-                'type': 'filtering',
-                'confidence': 0.8
-            }
-        
-        # Default to general query
+        intent_type, confidence = _classify_intent_cached(query.lower())
         return {
-            'type': 'general',
-            'confidence': 0.5
+            'type': intent_type,
+            'confidence': confidence
         }
     
     def _extract_temporal_context(self, query: str) -> Dict:
@@ -200,14 +393,11 @@ class MoraqibRAG:
         Returns:
             Dict with temporal filters
         """
-        query_lower = query.lower()
-        now = datetime.now()
-        
-        # Check for ordinal numbers (1st, 2nd, 3rd, 13th, etc.)
-        # Matches: "1st report", "2nd report", "3rd report", "13th report", "13rd report" (typo)
-        ordinal_match = re.search(r'(\d+)(?:st|nd|rd|th) report', query_lower)
-        if ordinal_match:
-            n = int(ordinal_match.group(1))
+        spec = _parse_temporal_spec(query.lower())
+        kind = spec[0]
+        
+        if kind == 'ordinal':
+            n = spec[1]
             return {
                 'type': 'ordinal',
                 'ordinal_position': n,
@@ -216,85 +406,34 @@ class MoraqibRAG:
                 'end_date': None
             }
         
-        # Check for "last N reports"
-        last_n_match = re.search(r'last (\d+) reports?', query_lower)
-        if last_n_match:
-            n = int(last_n_match.group(1))
+        if kind == 'last_n':
             return {
                 'type': 'last_n',
-                'limit': n,
+                'limit': spec[1],
                 'start_date': None,
                 'end_date': None
             }
         
-        # Check for "last report" (singular)
-        if 'last report' in query_lower or 'latest report' in query_lower or 'most recent report' in query_lower:
+        if kind == 'recent':
+            # Default: return recent reports
             return {
-                'type': 'last_n',
-                'limit': 1,
+                'type': 'recent',
+                'limit': 100,
                 'start_date': None,
                 'end_date': None
             }
         
-        # Check for time ranges
-        if 'today' in query_lower:
-            start_of_day = now.replace(hour=0, minute=0, second=0, microsecond=0)
-            return {
-                'type': 'date_range',
-                'limit': 1000,
-                'start_date': start_of_day,
-                'end_date': now
-            }
-        
-        if 'yesterday' in query_lower:
-            yesterday_start = (now - timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
-            yesterday_end = yesterday_start + timedelta(days=1)
-            return {
-                'type': 'date_range',
-                'limit': 1000,
-                'start_date': yesterday_start,
-                'end_date': yesterday_end
-            }
-        
-        if 'last week' in query_lower or 'past week' in query_lower:
-            start_date = now - timedelta(days=7)
-            return {
-                'type': 'date_range',
-                'limit': 1000,
-                'start_date': start_date,
-                'end_date': now
-            }
-        
-        if 'last month' in query_lower or 'past month' in query_lower:
-            start_date = now - timedelta(days=30)
-            return {
-                'type': 'date_range',
-                'limit': 1000,
-                'start_date': start_date,
-                'end_date': now
-            }
-        
-        # Check for "last N days"
-        days_match = re.search(r'last (\d+) days?', query_lower)
-        if days_match:
-            n_days = int(days_match.group(1))
-            start_date = now - timedelta(days=n_days)
-            return {
-                'type': 'date_range',
-                'limit': 1000,
-                'start_date': start_date,
-                'end_date': now
-            }
+        # Date ranges are resolved against the current time
+        start_date, end_date = _DATE_RANGE_RESOLVERS[kind](datetime.now(), spec)
         
-        # Default: return recent reports
         return {
-            'type': 'recent',
-            'limit': 100,
-            'start_date': None,
-            'end_date': None
+            'type': 'date_range',
+            'limit': 1000,
+            'start_date': start_date,
+            'end_date': end_date
         }
     
-    def _retrieve_reports(
+    async def _retrieve_reports(
         self,
         intent: Dict,
         temporal_context: Dict,
@@ -336,7 +475,10 @@ class MoraqibRAG:
                 print("❌ Local Database not initialized")
                 return []
             
-            reports = self.database.query_reports(
+            # SQLite I/O runs in a worker thread so concurrent queries overlap
+            # their retrieval with other requests' LLM calls on the event loop
+            reports = await asyncio.to_thread(
+                self.database.query_reports,
                 start_date=start_date,
                 end_date=end_date,
                 device_id=device_id,
@@ -347,32 +489,55 @@ class MoraqibRAG:
         
         except Exception as e:
             print(f"❌ Error retrieving reports: {e}")
-            import traceback
             traceback.print_exc()
             return []
     
-    def _extract_device_id(self, query: str) -> Optional[str]:
+    def _rank_reports(
+        self,
+        query: str,
+        reports: List[Dict],
+        intent: Dict,
+        temporal_context: Dict
+    ) -> List[Dict]:
         """
-        Extract device ID from query if mentioned
+        Rerank retrieved reports with BM25 and truncate to max_reports_in_context
+        
+        Aggregation, latest, summary and filtering queries, and ordinal, last-N and
+        date-range lookups, need the full retrieved set, so they are returned unchanged.
         
         Args:
             query: User's question
+            reports: Retrieved reports
+            intent: Query intent classification
+            temporal_context: Temporal filters
         
         Returns:
-            Device ID string or None
+            Reports to include in the LLM context
         """
-        query_lower = query.lower()
+        k = self.max_reports_in_context
+        if (
+            k <= 0
+            or len(reports) <= k
+            or intent['type'] in _UNRANKED_INTENTS
+            or temporal_context.get('type') in _UNRANKED_TEMPORAL_TYPES
+        ):
+            return reports
         
-        # Look for patterns like "Pi-001", "device Pi-001", "from Pi-001"
-        device_match = re.search(r'pi-\d{3}', query_lower, re.IGNORECASE)
-        if device_match:
-            return device_match.group(0).upper()
+        ranked = _bm25_top_k(query, reports, k)
+        print(f"🎯 Reranked to top {len(ranked)} of {len(reports)} reports")
+        return ranked
+    
+    def _extract_device_id(self, query: str) -> Optional[str]:
+        """
+        Extract device ID from query if mentioned
         
-        # Look for "web upload" or "web-upload"
-        if 'web' in query_lower and ('upload' in query_lower or 'uploaded' in query_lower):
-            return "Web-Upload"
+        Args:
+            query: User's question
         
-        return None
+        Returns:
+            Device ID string or None
+        """
+        return _extract_device_id_cached(query.lower())
     
     async def _generate_answer(
         self,
@@ -472,17 +637,36 @@ Please answer the question based on the detection reports above. Be specific and
 
         try:
             # Call OpenAI API
-            response = self.client.chat.completions.create(
+            # Stream the completion so the first tokens arrive without waiting for the full body
+            request_start = time.perf_counter()
+            first_token_time = None
+            stream = await self.client.chat.completions.create(
                 model="gpt-4-turbo",
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_prompt}
                 ],
                 temperature=0.7,
-                max_tokens=1500
+                max_tokens=1500,
+                stream=True
             )
-            answer = response.choices[0].message.content
-            print(f"✅ Generated answer ({len(answer)} chars)")
+            answer_parts = []
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if first_token_time is None:
+                        first_token_time = time.perf_counter() - request_start
+                    answer_parts.append(delta)
+            answer = ''.join(answer_parts)
+            print(f"✅ Generated answer ({len(answer)} chars, first token after {first_token_time or 0:.2f}s)")
+            
+            # Only successful LLM answers are cached (never the fallback text)
+            if RAG_ANSWER_CACHE:
+                self._answer_cache[self._answer_cache_key(query, reports)] = answer
+                if len(self._answer_cache) > ANSWER_CACHE_SIZE:
+                    self._answer_cache.popitem(last=False)
             
             return answer
         
@@ -551,16 +735,10 @@ Location: ({location.get('latitude', 0)}, {location.get('longitude', 0)})
         
         # Add individual reports (limit to 50 for context window)
         context_parts.append("Individual Reports:")
-        for i, report in enumerate(reports[:50], 1):
-            location = report.get('location', {})
-            context_parts.append(f"\n{i}. Report: {report.get('report_id', 'Unknown')}")
-            context_parts.append(f"   Time: {report.get('timestamp', 'Unknown')}")
-            context_parts.append(f"   Soldiers: {report.get('soldier_count', 0)}")
-            context_parts.append(f"   Environment: {report.get('environment', 'Unknown')}")
-            context_parts.append(f"   Attire: {report.get('attire_and_camouflage', 'Unknown')}")
-            context_parts.append(f"   Equipment: {report.get('equipment', 'Unknown')}")
-            context_parts.append(f"   Device: {report.get('source_device_id', 'Unknown')}")
-            context_parts.append(f"   Location: ({location.get('latitude', 0)}, {location.get('longitude', 0)})")
+        if reports:
+            context_parts.append("\n".join(
+                _format_report_block(i, report) for i, report in enumerate(reports[:50], 1)
+            ))
         
         if len(reports) > 50:
             context_parts.append(f"\n... and {len(reports) - 50} more reports")
@@ -14,6 +14,9 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
+# Queries evaluated at once; keeps per-query latency free of pool / rate-limit queueing
+EVAL_CONCURRENCY = int(os.getenv("RAG_EVAL_CONCURRENCY", "4"))
+
 # Check if PROMPTLAYER_API_KEY is set
 if not os.getenv("PROMPTLAYER_API_KEY"):
     print("⚠️ Warning: PROMPTLAYER_API_KEY not found in environment")
@@ -81,53 +84,15 @@ class RAGEvaluator:
         
         evaluation_start = time.time()
         
+        # Run queries concurrently, at most EVAL_CONCURRENCY at a time
+        semaphore = asyncio.Semaphore(EVAL_CONCURRENCY)
+        tasks = []
         for category, queries in self.test_queries.items():
-            print(f"\n📊 Testing {category.replace('_', ' ').title()}...")
-            
             for query in queries:
                 current_query += 1
-                print(f"\n[{current_query}/{total_queries}] Query: {query}")
-                
-                try:
-                    # Run query and measure performance
-                    query_start = time.time()
-                    result = await self.rag.query(query)
-                    query_time = time.time() - query_start
-                    
-                    # Analyze result quality
-                    quality_score = self._evaluate_response_quality(query, result)
-                    
-                    # Store evaluation result
-                    eval_result = {
-                        "query": query,
-                        "category": category,
-                        "success": result.get("success", False),
-                        "response_time": query_time,
-                        "quality_score": quality_score,
-                        "reports_used": result.get("reports_count", 0),
-                        "answer_length": len(result.get("answer", "")),
-                        "timestamp": datetime.now().isoformat(),
-                        "answer": result.get("answer", "")[:200] + "..." if len(result.get("answer", "")) > 200 else result.get("answer", "")
-                    }
-                    
-                    self.evaluation_results.append(eval_result)
-                    
-                    # Print result summary
-                    status = "✅" if result.get("success") else "❌"
-                    print(f"   {status} Success: {result.get('success')}")
-                    print(f"   ⏱️  Time: {query_time:.2f}s")
-                    print(f"   📊 Quality: {quality_score}/10")
-                    print(f"   📚 Reports: {result.get('reports_count', 0)}")
-                    
-                except Exception as e:
-                    print(f"   ❌ Error: {str(e)}")
-                    self.evaluation_results.append({
-                        "query": query,
-                        "category": category,
-                        "success": False,
-                        "error": str(e),
-                        "timestamp": datetime.now().isoformat()
-                    })
+                tasks.append(self._evaluate_query(category, query, current_query, total_queries, semaphore))
+        
+        self.evaluation_results.extend(await asyncio.gather(*tasks))
         
         # Calculate overall metrics
         total_time = time.time() - evaluation_start
@@ -158,6 +123,50 @@ class RAGEvaluator:
             "detailed_results": self.evaluation_results
         }
     
+    async def _evaluate_query(self, category: str, query: str, index: int, total: int,
+                              semaphore: asyncio.Semaphore) -> Dict[str, Any]:
+        """Run a single evaluation query and return its result record"""
+        try:
+            # Run query and measure performance (timed only once it holds a slot)
+            async with semaphore:
+                query_start = time.time()
+                result = await self.rag.query(query)
+                query_time = time.time() - query_start
+            
+            # Analyze result quality
+            quality_score = self._evaluate_response_quality(query, result)
+            
+            # Print result summary
+            status = "✅" if result.get("success") else "❌"
+            print(f"\n[{index}/{total}] ({category}) Query: {query}")
+            print(f"   {status} Success: {result.get('success')}")
+            print(f"   ⏱️  Time: {query_time:.2f}s")
+            print(f"   📊 Quality: {quality_score}/10")
+            print(f"   📚 Reports: {result.get('reports_count', 0)}")
+            
+            return {
+                "query": query,
+                "category": category,
+                "success": result.get("success", False),
+                "response_time": query_time,
+                "quality_score": quality_score,
+                "reports_used": result.get("reports_count", 0),
+                "answer_length": len(result.get("answer", "")),
+                "timestamp": datetime.now().isoformat(),
+                "answer": result.get("answer", "")[:200] + "..." if len(result.get("answer", "")) > 200 else result.get("answer", "")
+            }
+            
+        except Exception as e:
+            print(f"\n[{index}/{total}] ({category}) Query: {query}")
+            print(f"   ❌ Error: {str(e)}")
+            return {
+                "query": query,
+                "category": category,
+                "success": False,
+                "error": str(e),
+                "timestamp": datetime.now().isoformat()
+            }
+    
     def _evaluate_response_quality(self, query: str, result: Dict) -> float:
         """
         Evaluate response quality on a scale of 1-10
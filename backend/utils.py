@@ -3,27 +3,117 @@ Utility functions for the Mirqab backend
 """
 
 import base64
+import binascii
 import io
+import os
+import shutil
+import subprocess
+import threading
 import cv2
 import numpy as np
 from PIL import Image
+from ccl_numba import NUMBA_AVAILABLE, USE_NUMBA_CCL, numba_component_stats
 
-def encode_image_to_base64(image: Image.Image, format: str = "JPEG") -> str:
+# Working H.264 encoders in order of preference (probed once per process)
+_h264_encoders = None
+
+# ffmpeg codec arguments per H.264 encoder, fastest first
+_H264_CODEC_ARGS = {
+    'h264_nvenc': ['-c:v', 'h264_nvenc', '-preset', 'p1', '-tune', 'll'],
+    'libx264': ['-c:v', 'libx264', '-preset', 'ultrafast'],
+}
+
+# 5x5 structuring element shared by the mask clean-up passes
+_MORPH_K5 = cv2.getStructuringElement(cv2.MORPH_RECT, (5, 5))
+
+# Per-thread scratch buffers reused across calls
+_thread_local = threading.local()
+
+# OpenCV encoders for the formats served to the frontend
+_CV2_EXTENSIONS = {"JPEG": ".jpg", "PNG": ".png"}
+
+def _encode_with_cv2(image, format: str, quality: int):
     """
-    Encode PIL Image to base64 string
+    Encode with OpenCV's libjpeg-turbo / libpng encoders
+    
+    Returns:
+        Encoded uint8 array, or None if the format / pixel layout needs PIL
+    """
+    ext = _CV2_EXTENSIONS.get(format)
+    if ext is None:
+        return None
+    # Only RGB / L PIL images share the array layout; P, YCbCr, HSV, LAB, ... go to PIL
+    if isinstance(image, Image.Image) and image.mode not in ("RGB", "L"):
+        return None
+    arr = np.asarray(image)
+    if arr.dtype != np.uint8 or not (arr.ndim == 2 or (arr.ndim == 3 and arr.shape[2] == 3)):
+        return None
+    bgr = cv2.cvtColor(arr, cv2.COLOR_RGB2BGR) if arr.ndim == 3 else arr
+    params = [cv2.IMWRITE_JPEG_QUALITY, quality] if format == "JPEG" else []
+    ok, encoded = cv2.imencode(ext, bgr, params)
+    return encoded if ok else None
+
+def _encode_with_pil(image, format: str, quality: int) -> io.BytesIO:
+    """Encode with PIL into a per-thread BytesIO that is rewound and reused across calls"""
+    buffered = getattr(_thread_local, 'encode_buffer', None)
+    if buffered is None:
+        buffered = _thread_local.encode_buffer = io.BytesIO()
+    buffered.seek(0)
+    buffered.truncate()
+    if isinstance(image, np.ndarray):
+        image = Image.fromarray(image)
+    image.save(buffered, format=format, quality=quality)
+    return buffered
+
+def encode_image_bytes(image, format: str = "JPEG", quality: int = 75) -> bytes:
+    """
+    Encode an image to JPEG/PNG bytes
+    
+    Uses OpenCV's libjpeg-turbo / libpng encoders directly on the pixel
+    array and falls back to PIL for other formats or image modes.
     
     Args:
-        image: PIL Image object
+        image: PIL Image or RGB numpy array
         format: Image format (JPEG, PNG)
+        quality: JPEG quality (PIL's default is 75)
+    
+    Returns:
+        Encoded image bytes
+    """
+    format = format.upper()
+    encoded = _encode_with_cv2(image, format, quality)
+    if encoded is not None:
+        return encoded.tobytes()
+    return _encode_with_pil(image, format, quality).getvalue()
+
+def bytes_to_data_uri(data, format: str = "JPEG") -> str:
+    """
+    Wrap already-encoded image bytes in a base64 data URI
+    
+    Args:
+        data: Encoded image bytes (or any buffer)
+        format: Image format of the bytes (JPEG, PNG)
     
     Returns:
         Base64 encoded string with data URI prefix
     """
-    buffered = io.BytesIO()
-    image.save(buffered, format=format)
-    img_base64 = base64.b64encode(buffered.getvalue()).decode('utf-8')
+    img_base64 = binascii.b2a_base64(data, newline=False).decode('ascii')
     return f"data:image/{format.lower()};base64,{img_base64}"
 
+def encode_image_to_base64(image, format: str = "JPEG", quality: int = 75) -> str:
+    """
+    Encode an image to base64 string
+    
+    Args:
+        image: PIL Image or RGB numpy array
+        format: Image format (JPEG, PNG)
+        quality: JPEG quality
+    
+    Returns:
+        Base64 encoded string with data URI prefix
+    """
+    return bytes_to_data_uri(encode_image_bytes(image, format, quality), format)
+
 def decode_base64_to_image(base64_string: str) -> Image.Image:
     """
     Decode base64 string to PIL Image
@@ -34,12 +124,92 @@ def decode_base64_to_image(base64_string: str) -> Image.Image:
     Returns:
         PIL Image object
     """
+    return Image.open(io.BytesIO(_decode_base64_payload(base64_string)))
+
+def decode_base64_to_array(base64_string: str) -> np.ndarray:
+    """
+    Decode base64 string straight to an RGB numpy array (no PIL object)
+    
+    Args:
+        base64_string: Base64 encoded image string (data URI prefix optional)
+    
+    Returns:
+        RGB image as (H, W, 3) uint8 array, ready for SegmentationModel.predict
+    """
+    return decode_image_bytes(_decode_base64_payload(base64_string))
+
+def _decode_base64_payload(base64_string: str) -> bytes:
+    """Strip an optional data URI prefix and decode the base64 payload"""
     # Remove data URI prefix if present
     if ',' in base64_string:
-        base64_string = base64_string.split(',')[1]
+        base64_string = base64_string.split(',', 1)[1]
     
-    img_bytes = base64.b64decode(base64_string)
-    return Image.open(io.BytesIO(img_bytes))
+    return base64.b64decode(base64_string)
+
+def decode_image_bytes(data: bytes) -> np.ndarray:
+    """
+    Decode encoded image bytes (JPEG, PNG, ...) to an RGB numpy array
+    
+    Uses OpenCV's libjpeg-turbo decoder and falls back to PIL for
+    formats OpenCV cannot read. EXIF orientation is ignored, as with PIL,
+    so masks and boxes stay in the stored pixel frame.
+    
+    Args:
+        data: Encoded image bytes
+    
+    Returns:
+        RGB image as (H, W, 3) uint8 array
+    """
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
+    if image is None:
+        return np.asarray(Image.open(io.BytesIO(data)).convert("RGB"))
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+def detect_soldiers_arrays(mask: np.ndarray, min_area: int = 100) -> dict:
+    """
+    Detect soldiers from binary segmentation mask as a struct of arrays (SoA)
+    
+    Args:
+        mask: Binary segmentation mask (0 = background, 1 = camouflage soldier)
+        min_area: Minimum pixels for valid detection
+    
+    Returns:
+        Dict with one row per detection:
+        'bboxes' (N, 4) int32 as x, y, width, height,
+        'centroids' (N, 2) float64 as x, y,
+        'areas' (N,) int32, 'confidences' (N,) float64
+    """
+    # For DeepLabV3 semantic segmentation, extract instances from the binary mask
+    # using connected components (OpenCV, or the Numba labeler when enabled)
+    components = component_stats(mask, min_area)
+    components["confidences"] = np.minimum(0.95, 0.7 + components["areas"] / 10000)
+    return components
+
+def detections_to_dict_list(detections: dict) -> list:
+    """
+    Convert detect_soldiers_arrays output to the legacy list of detection dicts
+    
+    Args:
+        detections: SoA dict from detect_soldiers_arrays
+    
+    Returns:
+        List of detection dictionaries with bounding boxes and metadata
+    """
+    # One tolist() per field, then a dict per detection
+    return [
+        {
+            "bbox": {"x": x, "y": y, "width": w, "height": h},
+            "centroid": {"x": cx, "y": cy},
+            "area": area,
+            "confidence": confidence,
+            "class_id": 0,
+            "class_name": "camouflage_soldier"
+        }
+        for (x, y, w, h), area, (cx, cy), confidence in zip(
+            detections["bboxes"].tolist(), detections["areas"].tolist(),
+            detections["centroids"].tolist(), detections["confidences"].tolist()
+        )
+    ]
 
 def detect_soldiers(mask: np.ndarray, instances=None) -> list:
     """
@@ -53,36 +223,7 @@ def detect_soldiers(mask: np.ndarray, instances=None) -> list:
     Returns:
         List of detection dictionaries with bounding boxes and metadata (soldiers only)
     """
-    detections = []
-    
-    # For DeepLabV3 semantic segmentation, extract instances from the binary mask
-    # using connected components
-    soldier_mask = (mask == 1).astype(np.uint8)
-    
-    # Find connected components with stats
-    num_labels, labels, stats, centroids = cv2.connectedComponentsWithStats(soldier_mask, connectivity=8)
-    
-    min_area = 100  # Minimum pixels for valid detection
-    
-    for i in range(1, num_labels):  # Skip background (label 0)
-        area = stats[i, cv2.CC_STAT_AREA]
-        if area >= min_area:
-            x = int(stats[i, cv2.CC_STAT_LEFT])
-            y = int(stats[i, cv2.CC_STAT_TOP])
-            w = int(stats[i, cv2.CC_STAT_WIDTH])
-            h = int(stats[i, cv2.CC_STAT_HEIGHT])
-            cx, cy = centroids[i]
-            
-            detections.append({
-                "bbox": {"x": x, "y": y, "width": w, "height": h},
-                "centroid": {"x": float(cx), "y": float(cy)},
-                "area": int(area),
-                "confidence": min(0.95, 0.7 + (area / 10000)),
-                "class_id": 0,
-                "class_name": "camouflage_soldier"
-            })
-    
-    return detections
+    return detections_to_dict_list(detect_soldiers_arrays(mask))
 
 def process_video(video_path: str, frame_callback, sample_rate: int = 30):
     """
@@ -90,29 +231,35 @@ def process_video(video_path: str, frame_callback, sample_rate: int = 30):
     
     Args:
         video_path: Path to video file
-        frame_callback: Function to call for each sampled frame
+        frame_callback: Function called as frame_callback(frame_rgb, frame_index) for each
+            sampled frame, where frame_rgb is an (H, W, 3) uint8 RGB numpy array
+            (use process_video_pil for callbacks that need a PIL Image)
         sample_rate: Process every Nth frame
     
     Returns:
         List of results from frame_callback
     """
     cap = cv2.VideoCapture(video_path)
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Live sources: no stale queued frames (ignored for files)
     results = []
     frame_count = 0
     
     while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
+        # grab() only demuxes; skipped frames are never decoded
+        if not cap.grab():
             break
         
         # Sample frames
         if frame_count % sample_rate == 0:
+            ret, frame = cap.retrieve()
+            if not ret:
+                break
+            
             # Convert BGR to RGB
             frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            image = Image.fromarray(frame_rgb)
             
-            # Process frame
-            result = frame_callback(image, frame_count)
+            # Process frame (array straight to the callback, no PIL round-trip)
+            result = frame_callback(frame_rgb, frame_count)
             results.append(result)
         
         frame_count += 1
@@ -120,20 +267,221 @@ def process_video(video_path: str, frame_callback, sample_rate: int = 30):
     cap.release()
     return results
 
+def process_video_pil(video_path: str, frame_callback, sample_rate: int = 30):
+    """
+    process_video for callbacks that take a PIL Image (compatibility wrapper)
+    
+    Prefer process_video with an array callback; this adds an Image.fromarray per sampled frame.
+    
+    Args:
+        video_path: Path to video file
+        frame_callback: Function called as frame_callback(pil_image, frame_index)
+        sample_rate: Process every Nth frame
+    
+    Returns:
+        List of results from frame_callback
+    """
+    return process_video(
+        video_path,
+        lambda frame_rgb, frame_index: frame_callback(Image.fromarray(frame_rgb), frame_index),
+        sample_rate
+    )
+
+def _get_ffmpeg_exe():
+    """Locate an ffmpeg binary (system install or the one bundled with imageio-ffmpeg)"""
+    exe = shutil.which("ffmpeg")
+    if exe:
+        return exe
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return None
+
+def _encoder_args(encoder: str) -> list:
+    """ffmpeg output arguments for an H.264 encoder, shared by the probe and the real encode"""
+    return [*_H264_CODEC_ARGS[encoder],
+            '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-pix_fmt', 'yuv420p']
+
+def _select_h264_encoders(ffmpeg_exe: str) -> list:
+    """
+    Probe the H.264 encoders once per process, with exactly the arguments used to encode
+    
+    Returns:
+        Working encoders in order of preference (e.g. ['h264_nvenc', 'libx264'])
+    """
+    global _h264_encoders
+    if _h264_encoders is None:
+        working = []
+        for encoder in _H264_CODEC_ARGS:
+            probe = subprocess.run(
+                [ffmpeg_exe, '-hide_banner', '-loglevel', 'error',
+                 '-f', 'lavfi', '-i', 'color=black:s=256x256:d=0.1',
+                 '-frames:v', '1', *_encoder_args(encoder), '-f', 'null', '-'],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+            if probe.returncode == 0:
+                working.append(encoder)
+        _h264_encoders = working
+        print(f"🎞️ Video encoders: {', '.join(working) or 'none (OpenCV mp4v)'}")
+    return _h264_encoders
+
+class FFmpegVideoWriter:
+    """
+    Minimal cv2.VideoWriter-compatible writer that pipes raw BGR frames to ffmpeg
+    and encodes H.264 with the given encoder
+    """
+    
+    def __init__(self, ffmpeg_exe: str, output_path: str, fps: float, frame_size: tuple, encoder: str):
+        width, height = frame_size
+        self.encoder = encoder
+        self._output_path = output_path
+        self._proc = subprocess.Popen(
+            [ffmpeg_exe, '-y', '-loglevel', 'error',
+             '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{width}x{height}',
+             '-r', str(fps or 30), '-i', '-',
+             *_encoder_args(encoder),
+             '-movflags', '+faststart', output_path],
+            stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+    
+    def isOpened(self) -> bool:
+        return self._proc.poll() is None
+    
+    def has_output(self) -> bool:
+        """True once ffmpeg has written to the output file (its encoder opened successfully)"""
+        try:
+            return os.path.getsize(self._output_path) > 0
+        except OSError:
+            return False
+    
+    def write(self, frame: np.ndarray):
+        self._proc.stdin.write(np.ascontiguousarray(frame).data)
+    
+    def release(self):
+        if self._proc.stdin and not self._proc.stdin.closed:
+            try:
+                self._proc.stdin.close()
+            except OSError:
+                pass  # ffmpeg already exited - reported by the exit code below
+        if self._proc.wait() != 0:
+            raise RuntimeError(f"ffmpeg ({self.encoder}) exited with code {self._proc.returncode}")
+
+class FallbackVideoWriter:
+    """
+    Video writer that falls back to the next encoder (NVENC -> libx264 -> OpenCV mp4v)
+    when ffmpeg fails. Frames are kept until ffmpeg has written output (so its encoder
+    really opened), so an encoder that fails to start is replaced without losing frames.
+    """
+    
+    def __init__(self, ffmpeg_exe: str, output_path: str, fps: float, frame_size: tuple):
+        self._ffmpeg_exe = ffmpeg_exe
+        self._output_path = output_path
+        self._fps = fps
+        self._frame_size = frame_size
+        self._candidates = list(_select_h264_encoders(ffmpeg_exe))
+        self._pending = []  # Frames kept for replay; None once the encoder is trusted
+        self._writer = self._open_next()
+    
+    def _open_next(self):
+        """Open the next candidate encoder, ending with OpenCV's mp4v writer"""
+        # Drop any partial file from a failed encoder so has_output() only sees the new one
+        if os.path.exists(self._output_path):
+            os.unlink(self._output_path)
+        if self._candidates:
+            encoder = self._candidates.pop(0)
+            return FFmpegVideoWriter(self._ffmpeg_exe, self._output_path, self._fps, self._frame_size, encoder)
+        print("⚠️ No working ffmpeg encoder, falling back to OpenCV mp4v encoder")
+        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+        return cv2.VideoWriter(self._output_path, fourcc, self._fps, self._frame_size)
+    
+    def _fail_over(self, error: Exception):
+        """Replace the failed encoder and replay the kept frames into the next one"""
+        while True:
+            if self._pending is None:
+                raise RuntimeError(f"Video encoding failed: {error}") from error
+            encoder = self._writer.encoder
+            print(f"⚠️ Video encoder {encoder} failed ({error}), trying the next one")
+            if encoder in _h264_encoders:
+                _h264_encoders.remove(encoder)  # Skip it for later videos too
+            try:
+                self._writer.release()
+            except (RuntimeError, OSError):
+                pass
+            self._writer = self._open_next()
+            try:
+                for frame in self._pending:
+                    self._writer.write(frame)
+            except OSError as e:
+                error = e
+                continue
+            if not isinstance(self._writer, FFmpegVideoWriter):
+                self._pending = None  # OpenCV's writer is the last resort
+            return
+    
+    def isOpened(self) -> bool:
+        return self._writer.isOpened()
+    
+    def write(self, frame: np.ndarray):
+        if self._pending is not None:
+            # Callers reuse their frame buffers, so keep a copy
+            self._pending.append(frame.copy())
+        try:
+            self._writer.write(frame)
+        except OSError as e:  # Broken pipe - ffmpeg exited
+            self._fail_over(e)
+        if self._pending is not None and (
+            not isinstance(self._writer, FFmpegVideoWriter)
+            or (self._writer.has_output() and self._writer.isOpened())
+        ):
+            self._pending = None  # ffmpeg is producing output - stop keeping frames
+    
+    def release(self):
+        while True:
+            try:
+                self._writer.release()
+                return
+            except RuntimeError as e:
+                self._fail_over(e)
+
+def open_video_writer(output_path: str, fps: float, frame_size: tuple):
+    """
+    Open a video writer for BGR frames
+    
+    Uses hardware-accelerated H.264 through ffmpeg when possible, falling back
+    to libx264 and then OpenCV's software mp4v writer if an encoder fails or
+    ffmpeg is not available.
+    
+    Args:
+        output_path: Destination video file
+        fps: Frames per second
+        frame_size: (width, height)
+    
+    Returns:
+        Writer object exposing write(frame) and release()
+    """
+    ffmpeg_exe = _get_ffmpeg_exe()
+    if ffmpeg_exe:
+        return FallbackVideoWriter(ffmpeg_exe, output_path, fps, frame_size)
+    
+    print("⚠️ ffmpeg not found, falling back to OpenCV mp4v encoder")
+    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+    return cv2.VideoWriter(output_path, fourcc, fps, frame_size)
+
 def create_colored_mask(mask: np.ndarray, color: tuple = (255, 0, 0)) -> np.ndarray:
     """
     Create a colored version of a binary mask
     
     Args:
-        mask: Binary mask (H, W)
+        mask: Binary mask (H, W) with values in {0, 1}
         color: RGB color tuple
     
     Returns:
         Colored mask (H, W, 3)
     """
-    colored = np.zeros((*mask.shape, 3), dtype=np.uint8)
-    colored[mask == 1] = color
-    return colored
+    # {0, 1} -> RGB lookup: one gather pass, no boolean temp or scatter
+    lut = np.array([(0, 0, 0), color], dtype=np.uint8)
+    return lut[mask.astype(np.uint8, copy=False)]
 
 def overlay_mask_on_image(image, mask, alpha: float = 0.5):
     """
@@ -147,9 +495,9 @@ def overlay_mask_on_image(image, mask, alpha: float = 0.5):
     Returns:
         PIL Image with overlay
     """
-    # Convert PIL to numpy if needed
+    # View PIL as numpy if needed (read-only; the overlay is written to a copy)
     if isinstance(image, Image.Image):
-        image_np = np.array(image)
+        image_np = np.asarray(image)
     else:
         image_np = image
     
@@ -169,23 +517,19 @@ def overlay_mask_on_image(image, mask, alpha: float = 0.5):
         return Image.fromarray(image_np) if isinstance(image, Image.Image) else image
     
     try:
-        # Create overlay
-        overlay = image_np.copy()
-        color_map = np.array([[0, 0, 0], [255, 0, 0]], dtype=np.uint8)  # Red for soldiers
-        colored_mask = color_map[mask]
-        
-        # Apply overlay where mask == 1
-        soldier_pixels = mask == 1
+        # Pixels left untouched (mask != 1) - computed once, used for the early-out and the merge
+        background = mask != 1
         
-        # Check if there are any soldier pixels to avoid empty array errors
-        if not soldier_pixels.any():
-            # No soldiers detected, return original image
+        # No soldiers detected: return original image before allocating anything frame-sized
+        if background.all():
             return Image.fromarray(image_np)
         
-        overlay[soldier_pixels] = cv2.addWeighted(
-            overlay[soldier_pixels], 1-alpha,
-            colored_mask[soldier_pixels], alpha, 0
-        )
+        colored_mask = create_colored_mask(mask, (255, 0, 0))  # Red for soldiers
+        
+        # Blend the whole frame in one SIMD pass, then restore the original where mask != 1
+        # (avoids gathering/scattering the soldier pixels and a separate copy of the image)
+        overlay = cv2.addWeighted(image_np, 1-alpha, colored_mask, alpha, 0)
+        np.copyto(overlay, image_np, where=background[..., None])
         
         # Return as PIL Image
         return Image.fromarray(overlay)
@@ -193,6 +537,62 @@ def overlay_mask_on_image(image, mask, alpha: float = 0.5):
         print(f"⚠️ Warning: Error in overlay_mask_on_image: {str(e)}, returning original image")
         return Image.fromarray(image_np) if isinstance(image, Image.Image) else image
 
+def _morph_buffers(shape: tuple):
+    """Two uint8 scratch masks of the given shape, reallocated only when the shape changes"""
+    buffers = getattr(_thread_local, 'morph_buffers', None)
+    if buffers is None or buffers[0].shape != shape:
+        buffers = (np.empty(shape, np.uint8), np.empty(shape, np.uint8))
+        _thread_local.morph_buffers = buffers
+    return buffers
+
+def _foreground(mask: np.ndarray, threshold: float) -> np.ndarray:
+    """
+    uint8 foreground mask (nonzero where mask > threshold) for OpenCV's labeler
+    
+    Binary uint8 masks are used as-is. Otherwise one SIMD cv2.compare writes
+    0/255 into a reused per-thread buffer (no bool temp, no astype copy).
+    """
+    if mask.dtype == np.uint8 and threshold == 0:
+        return mask
+    binary = getattr(_thread_local, 'foreground', None)
+    if binary is None or binary.shape != mask.shape:
+        binary = _thread_local.foreground = np.empty(mask.shape, np.uint8)
+    try:
+        cv2.compare(mask, threshold, cv2.CMP_GT, dst=binary)
+    except cv2.error:
+        # dtypes OpenCV cannot compare (e.g. int64 / bool on older builds)
+        np.greater(mask, threshold, out=binary.view(bool))
+    return binary
+
+def component_stats(mask: np.ndarray, min_area: int = 100, threshold: float = 0) -> dict:
+    """
+    Label 8-connected components of mask > threshold and return their stats
+    
+    Uses OpenCV's connectedComponentsWithStats, or the Numba kernel in
+    ccl_numba when enabled (USE_NUMBA_CCL) and installed.
+    
+    Args:
+        mask: 2D mask (binary uint8 or float probabilities)
+        min_area: Minimum component area in pixels
+        threshold: Pixels strictly above this value are foreground
+    
+    Returns:
+        Dict of arrays, one row per kept component:
+        'areas' (N,) int32, 'bboxes' (N, 4) int32 as x, y, width, height,
+        'centroids' (N, 2) float64 as x, y
+    """
+    if USE_NUMBA_CCL and NUMBA_AVAILABLE:
+        return numba_component_stats(mask, min_area, threshold)
+    
+    binary = _foreground(mask, threshold)
+    _, _, stats, centroids = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    idxs = np.nonzero(stats[1:, cv2.CC_STAT_AREA] >= min_area)[0] + 1  # Skip background (label 0)
+    return {
+        "areas": stats[idxs, cv2.CC_STAT_AREA],
+        "bboxes": stats[idxs, :4],
+        "centroids": centroids[idxs],
+    }
+
 def estimate_object_count(mask: np.ndarray, min_area: int = 500) -> int:
     """
     Estimate number of objects in a binary mask
@@ -204,23 +604,25 @@ def estimate_object_count(mask: np.ndarray, min_area: int = 500) -> int:
     Returns:
         Estimated object count
     """
-    # Morphological operations to clean up mask
-    kernel = np.ones((5, 5), np.uint8)
-    cleaned = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
-    cleaned = cv2.morphologyEx(cleaned, cv2.MORPH_OPEN, kernel)
+    # Morphological operations to clean up mask (into reused per-thread buffers)
+    mask = mask.astype(np.uint8, copy=False)
+    closed, cleaned = _morph_buffers(mask.shape)
+    cv2.morphologyEx(mask, cv2.MORPH_CLOSE, _MORPH_K5, dst=closed)
+    cv2.morphologyEx(closed, cv2.MORPH_OPEN, _MORPH_K5, dst=cleaned)
     
-    # Find contours
-    contours, _ = cv2.findContours(
-        cleaned.astype(np.uint8),
-        cv2.RETR_EXTERNAL,
-        cv2.CHAIN_APPROX_SIMPLE
-    )
+    # Find outer contours (nested blobs are not counted separately)
+    contours, _ = cv2.findContours(cleaned, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
     
-    # Count contours with area above threshold
+    # Count contours whose enclosed (polygon) area reaches the threshold
     count = sum(1 for c in contours if cv2.contourArea(c) >= min_area)
     
     return count
 
+# Accepted upload dimensions and modes
+_MIN_IMAGE_SIZE = 100
+_MAX_IMAGE_SIZE = 4096
+_VALID_MODES = frozenset({'RGB', 'RGBA', 'L'})
+
 def validate_image(image: Image.Image) -> bool:
     """
     Validate that image is suitable for processing
@@ -231,21 +633,17 @@ def validate_image(image: Image.Image) -> bool:
     Returns:
         True if valid, False otherwise
     """
-    # Check minimum dimensions
-    min_size = 100
-    if image.width < min_size or image.height < min_size:
-        return False
-    
-    # Check maximum dimensions (to prevent memory issues)
-    max_size = 4096
-    if image.width > max_size or image.height > max_size:
-        return False
-    
-    # Check mode
-    if image.mode not in ['RGB', 'RGBA', 'L']:
-        return False
-    
-    return True
+    # Dimensions within [100, 4096] (upper bound prevents memory issues) and a supported mode
+    width, height = image.size
+    return (
+        _MIN_IMAGE_SIZE <= width <= _MAX_IMAGE_SIZE
+        and _MIN_IMAGE_SIZE <= height <= _MAX_IMAGE_SIZE
+        and image.mode in _VALID_MODES
+    )
+
+# 8-bit modes whose pixels can be area-averaged directly as arrays
+# (RGBA stays on PIL, which premultiplies alpha before resampling)
+_CV2_RESIZE_MODES = frozenset({'RGB', 'L'})
 
 def resize_image_if_needed(image: Image.Image, max_size: int = 2048) -> Image.Image:
     """
@@ -263,6 +661,11 @@ def resize_image_if_needed(image: Image.Image, max_size: int = 2048) -> Image.Im
     
     # Calculate new size maintaining aspect ratio
     ratio = min(max_size / image.width, max_size / image.height)
-    new_size = (int(image.width * ratio), int(image.height * ratio))
+    new_size = (max(1, int(image.width * ratio)), max(1, int(image.height * ratio)))
+    
+    # Downscale with OpenCV's SIMD area filter; palette/other modes keep PIL's Lanczos
+    if image.mode in _CV2_RESIZE_MODES:
+        resized = cv2.resize(np.asarray(image), new_size, interpolation=cv2.INTER_AREA)
+        return Image.fromarray(resized)
     
     return image.resize(new_size, Image.Resampling.LANCZOS)
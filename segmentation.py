@@ -85,7 +85,7 @@ from PIL import Image
 import numpy as np
 import os
 import sys
-import base64
+import binascii
 import io
 import asyncio
 import traceback
@@ -110,6 +110,13 @@ from backend.firestore_handler import FirestoreHandler
 from backend.firebase_storage_handler import FirebaseStorageHandler
 from backend.llm_handler import LLMReportGenerator
 
+# Persistent keep-alive HTTP session shared by the report path
+# (reuses the TCP connection instead of reconnecting on every report)
+_http_session = requests.Session()
+_http_adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=2)
+_http_session.mount('http://', _http_adapter)
+_http_session.mount('https://', _http_adapter)
+
 # ============================================================================
 # GPU Initialization and Optimization
 # ============================================================================
@@ -425,7 +432,7 @@ def get_device_location() -> Dict[str, float]:
     # Fallback: IP-based geolocation (works on all platforms)
     try:
         print("   📡 Requesting location from IP geolocation service...")
-        response = requests.get('http://ip-api.com/json/', timeout=10)
+        response = _http_session.get('http://ip-api.com/json/', timeout=10)
         
         if response.status_code == 200:
             data = response.json()
@@ -508,7 +515,7 @@ class ReportGenerator:
         """Convert OpenCV frame to base64 string"""
         try:
             _, buffer = cv2.imencode('.jpg', frame)
-            img_base64 = base64.b64encode(buffer).decode('utf-8')
+            img_base64 = binascii.b2a_base64(buffer, newline=False).decode('ascii')
             return img_base64
         except Exception as e:
             print(f"❌ Error converting frame to base64: {e}")
@@ -757,6 +764,10 @@ def main():
     if not camera.isOpened():
         print("❌ Failed to open webcam")
         exit(1)
+    
+    # Keep only the newest frame queued so each read() returns the current scene,
+    # not one captured several (slower-than-camera) inference steps ago
+    camera.set(cv2.CAP_PROP_BUFFERSIZE, 1)
 
     frame_count = 0
     detection_frame = None